@@ -0,0 +1,139 @@
+import os
+import time
+import asyncio
+import itertools
+from contextlib import asynccontextmanager
+from typing import Optional
+from metrics import metrics
+
+# Generations running at once in this worker
+MAX_CONCURRENT_GENERATIONS = int(os.getenv("MAX_CONCURRENT_GENERATIONS", 8))
+# Generations one user can have running at once; the rest wait their turn
+PER_USER_CONCURRENCY = int(os.getenv("PER_USER_CONCURRENCY", 2))
+# Slots batch work may occupy, so interactive requests always find one free
+BATCH_MAX_CONCURRENT = int(os.getenv("BATCH_MAX_CONCURRENT", max(1, MAX_CONCURRENT_GENERATIONS // 2)))
+MAX_QUEUE_LENGTH = int(os.getenv("MAX_QUEUE_LENGTH", 100))
+MAX_QUEUED_PER_USER = int(os.getenv("MAX_QUEUED_PER_USER", 10))
+
+# Share of the queue each tier gets under contention
+TIER_WEIGHTS = {"interactive": 4.0, "batch": 1.0}
+DEFAULT_TIER = "interactive"
+
+
+class QueueFullError(Exception):
+    """Raised when a generation cannot even be queued"""
+
+
+class Ticket:
+    """A generation waiting for, or holding, a slot"""
+
+    def __init__(self, user: str, tier: str, start: float, finish: float, seq: int):
+        self.user = user
+        self.tier = tier
+        self.start = start
+        self.finish = finish
+        self.seq = seq
+        self.enqueued_at = time.monotonic()
+        self.granted = asyncio.Event()
+
+    @property
+    def order(self) -> tuple[float, int]:
+        return self.finish, self.seq
+
+
+class AdmissionScheduler:
+    """
+    Weighted fair queue in front of the LLM.
+    Each (user, tier) is a flow whose requests are tagged with virtual finish
+    times advanced by cost / tier weight, so a user submitting many or large
+    requests only delays their own later requests. Slots go to the smallest
+    finish tag whose user is under the per-user cap.
+    """
+
+    def __init__(self):
+        self._queued: list[Ticket] = []
+        self._running: dict[str, int] = {}
+        self._running_batch = 0
+        self._active = 0
+        self._virtual_time = 0.0
+        self._flow_finish: dict[tuple[str, str], float] = {}
+        self._seq = itertools.count()
+
+    def enqueue(self, user: str, tier: str = DEFAULT_TIER, cost: float = 1.0) -> Ticket:
+        if len(self._queued) >= MAX_QUEUE_LENGTH:
+            metrics.incr("admission.rejected")
+            raise QueueFullError("The server is busy, please try again shortly")
+        if sum(ticket.user == user for ticket in self._queued) >= MAX_QUEUED_PER_USER:
+            metrics.incr("admission.rejected")
+            raise QueueFullError("Too many of your generations are already waiting")
+
+        start = max(self._virtual_time, self._flow_finish.get((user, tier), 0.0))
+        finish = start + max(cost, 1.0) / TIER_WEIGHTS[tier]
+        self._flow_finish[(user, tier)] = finish
+        ticket = Ticket(user, tier, start, finish, next(self._seq))
+        self._queued.append(ticket)
+        self._dispatch()
+        return ticket
+
+    def _eligible(self, ticket: Ticket) -> bool:
+        if self._running.get(ticket.user, 0) >= PER_USER_CONCURRENCY:
+            return False
+        return ticket.tier != "batch" or self._running_batch < BATCH_MAX_CONCURRENT
+
+    def _dispatch(self) -> None:
+        while self._active < MAX_CONCURRENT_GENERATIONS:
+            eligible = [ticket for ticket in self._queued if self._eligible(ticket)]
+            if not eligible:
+                return
+            ticket = min(eligible, key=lambda t: t.order)
+            self._queued.remove(ticket)
+            self._active += 1
+            self._running[ticket.user] = self._running.get(ticket.user, 0) + 1
+            if ticket.tier == "batch":
+                self._running_batch += 1
+            self._virtual_time = max(self._virtual_time, ticket.start)
+            metrics.observe(f"admission.wait_seconds.{ticket.tier}", time.monotonic() - ticket.enqueued_at)
+            ticket.granted.set()
+
+    def position(self, ticket: Ticket) -> int:
+        """1-based place in the queue, 0 once the ticket holds a slot"""
+        if ticket.granted.is_set():
+            return 0
+        return sum(other.order < ticket.order for other in self._queued) + 1
+
+    def release(self, ticket: Ticket) -> None:
+        """Give back a slot, or leave the queue if it was never granted"""
+        if ticket.granted.is_set():
+            self._active -= 1
+            self._running[ticket.user] -= 1
+            if not self._running[ticket.user]:
+                del self._running[ticket.user]
+            if ticket.tier == "batch":
+                self._running_batch -= 1
+        elif ticket in self._queued:
+            self._queued.remove(ticket)
+        if not self._active and not self._queued:
+            # Idle: restart virtual time so tags stay small
+            self._virtual_time = 0.0
+            self._flow_finish.clear()
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, user: str, tier: str = DEFAULT_TIER, cost: float = 1.0):
+        """Hold a generation slot for the duration of the block"""
+        ticket = self.enqueue(user, tier, cost)
+        try:
+            await ticket.granted.wait()
+            yield ticket
+        finally:
+            self.release(ticket)
+
+    def snapshot(self) -> dict:
+        return {
+            "active": self._active,
+            "queued": len(self._queued),
+            "runningByUser": dict(self._running),
+        }
+
+
+admission = AdmissionScheduler()
@@ -1,32 +1,62 @@
 import os
-from fastapi import FastAPI, HTTPException, Request
-from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
+# First, so the startup profile measures the imports below
+from startup import WARMUP_ON_STARTUP, connect_with_retry, profile, warm_up
+from fastapi import FastAPI, HTTPException, Query, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import Optional, AsyncGenerator
+from starlette.requests import HTTPConnection
+from pydantic import BaseModel, Field
+from typing import Optional, AsyncGenerator, Literal
 import asyncio
+import hmac
 import json
-from langchain_openai import ChatOpenAI
+import logging
+import uuid
+from contextlib import contextmanager
 from langchain_core.messages import HumanMessage, SystemMessage
 from langchain_core.output_parsers import StrOutputParser
-from reportlab.lib.pagesizes import letter
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, PageBreak
-from reportlab.lib.units import inch
-from reportlab.lib.enums import TA_CENTER, TA_JUSTIFY
-from docx import Document
-from docx.shared import Pt, Inches
-from docx.enum.text import WD_ALIGN_PARAGRAPH
+from langchain_core.runnables import Runnable
 import datetime as dt
 from pathlib import Path
 import re
 from dotenv import load_dotenv
+from bson import ObjectId
 from db_connect import get_database, close_database
-from models import SRSDocument, SRSRepository
+from models import CHECKPOINT_FIELDS, SRSDocument, SRSRepository, UsageRepository, decompress_partial
+from downloads import conditional_file_response, iter_zip
+from prompts import LEGACY_PROMPT_VERSION, PromptTemplate, registry as prompt_registry, template_sections
+from llm_router import DEFAULT_TEMPERATURE, MAX_OUTPUT_TOKENS, MODEL_TIERS, RoutingDecision, route_request, route_section
+from metrics import metrics
+from singleflight import generations, request_fingerprint
+from similarity import DRAFT_THRESHOLD, FIELD_NAMES, REUSE_THRESHOLD, srs_index
+from sections import assemble_sections, find_section, parse_sections, strip_heading
+from compression import compress_stream, compressed_json_response, sse_encoding
+from shared_state import store as shared_store
+from docx_renderer import get_template as get_docx_template, render_docx
+from pdf_renderer import render_pdf
+from admission import DEFAULT_TIER, QueueFullError, admission
+from logs import CorrelationMiddleware, job_id_var, setup_logging, stop_logging
+from usage import USAGE_FLUSH_INTERVAL, QuotaExceededError, estimate_tokens, response_usage, usage_tracker
+from drafts import DRAFT_MAX_TOKENS, draft_key, get_draft, parse_plan, plan_instruction, save_draft
+from localization import TRANSLATION_TEMPERATURE, requested_languages, translate_document, translation_budget
+from websocket_jobs import GenerationControl, JobMultiplexer
+from profiling import PROFILE_MAX_SECONDS, ProfilerBusyError, profiler
+from continuation import (
+    CONTINUE_INSTRUCTION, MAX_CONTINUATIONS, SUMMARY_INSTRUCTION, Continuation,
+    continuation_messages, join_continuation, missing_sections, plan_continuation
+)
 
 # Load environment variables
 load_dotenv()
 
+# JSON logs written from a background thread, see logs.py
+setup_logging()
+logger = logging.getLogger(__name__)
+
+# LangChain's OpenAI client, ReportLab and python-docx are imported where they are
+# used and preloaded by warm_up(), so they stay off the cold start path
+profile.record("app imports", "import", profile.started)
+
 app = FastAPI(title="SRS Generation API")
 
 # CORS Configuration
@@ -36,7 +66,10 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Request-ID"],
 )
+# Outermost, so the request id covers CORS responses and the access log covers whole streams
+app.add_middleware(CorrelationMiddleware)
 
 # Base directories for document storage
 BASE_STORAGE_DIR = Path(__file__).parent / "storage"
@@ -46,34 +79,146 @@ BASE_STORAGE_DIR.mkdir(exist_ok=True)
 db = None
 srs_repo = None
 
+# Background startup tasks, kept referenced so they are not garbage collected
+startup_tasks: list[asyncio.Task] = []
+
+# Time given to running generations to finish on shutdown, see gunicorn.conf.py
+SSE_DRAIN_TIMEOUT = float(os.getenv("SSE_DRAIN_TIMEOUT", 120))
+shutting_down = False
+
+# Seconds between checkpoints of a running generation's text
+CHECKPOINT_INTERVAL = float(os.getenv("CHECKPOINT_INTERVAL", 5))
+# A "Processing" record without a checkpoint for this long belongs to a dead process;
+# every worker sweeps for such records this often
+STALE_GENERATION_SECONDS = float(os.getenv("STALE_GENERATION_SECONDS", 120))
+# "resume" finishes interrupted generations, "fail" just marks them Failed
+RECOVERY_POLICY = os.getenv("RECOVERY_POLICY", "resume")
+RECOVERY_MAX_ATTEMPTS = int(os.getenv("RECOVERY_MAX_ATTEMPTS", 2))
+# How often each worker publishes its counters to the shared store
+METRICS_PUBLISH_INTERVAL = float(os.getenv("METRICS_PUBLISH_INTERVAL", 10))
+# Tries to store a rewritten section while other edits of the same SRS keep landing first
+SECTION_WRITE_ATTEMPTS = 3
+# Token for the /admin endpoints (X-Admin-Token header); unset disables them
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
+async def publish_metrics():
+    """Share this worker's counters so /metrics on any worker can report all of them"""
+    key = f"metrics:worker:{os.getpid()}"
+    while True:
+        try:
+            counters = json.dumps(metrics.snapshot()["counters"])
+            await asyncio.to_thread(shared_store.set, key, counters, METRICS_PUBLISH_INTERVAL * 3)
+        except Exception as e:
+            logger.warning("Failed to publish metrics: %s", e)
+        await asyncio.sleep(METRICS_PUBLISH_INTERVAL)
+
+def collect_worker_counters() -> dict:
+    """Counters published by every live worker, keyed by pid"""
+    workers = {}
+    for key in shared_store.keys("metrics:worker:"):
+        value = shared_store.get(key)
+        if value:
+            workers[key.rsplit(":", 1)[1]] = json.loads(value)
+    return workers
+
+async def flush_usage():
+    """Write the token counters gathered since the last flush in one batch"""
+    while True:
+        await asyncio.sleep(USAGE_FLUSH_INTERVAL)
+        try:
+            await asyncio.to_thread(usage_tracker.flush)
+        except Exception as e:
+            logger.warning("Failed to flush usage counters: %s", e)
+
+def init_database():
+    """Connect to MongoDB (blocking) and set up the repository"""
+    global db, srs_repo
+    db = get_database()
+    srs_repo = SRSRepository(db)
+    usage_tracker.repo = UsageRepository(db)
+    logger.info("Database initialized")
+
+async def start_database():
+    """Connect, then keep picking up generations interrupted by a dead process"""
+    await connect_with_retry(init_database)
+    # A process that died moments ago leaves records that only go stale later,
+    # so sweeping once at startup is not enough
+    while True:
+        try:
+            await recover_stale_generations()
+        except Exception as e:
+            logger.exception("Recovery sweep failed")
+        await asyncio.sleep(STALE_GENERATION_SECONDS)
+
 @app.on_event("startup")
 async def startup_db_client():
-    """Initialize MongoDB connection on startup"""
-    global db, srs_repo
-    try:
-        db = get_database()
-        srs_repo = SRSRepository(db)
-        print("[+] Database initialized")
-    except Exception as e:
-        print(f"[-] Failed to initialize database: {e}")
+    """Connect to MongoDB and warm up in the background so the server starts listening at once"""
+    profile.expect("database", "warmup")
+    startup_tasks.append(asyncio.create_task(start_database()))
+    if WARMUP_ON_STARTUP:
+        startup_tasks.append(asyncio.create_task(asyncio.to_thread(warm_up, (get_docx_template,))))
+    else:
+        profile.mark("warmup")
+    startup_tasks.append(asyncio.create_task(flush_usage()))
+    if shared_store.shared:
+        startup_tasks.append(asyncio.create_task(publish_metrics()))
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
-    """Close MongoDB connection on shutdown"""
+    """Let running generations finish, then close MongoDB connection on shutdown"""
+    global shutting_down
+    shutting_down = True
+    for task in startup_tasks:
+        task.cancel()
+    # The server has already waited for open client connections; this covers
+    # generations that keep running after their clients disconnected
+    abandoned = await generations.drain(SSE_DRAIN_TIMEOUT)
+    if abandoned:
+        logger.warning("Cancelled %d generation(s) still running at shutdown", abandoned)
+    try:
+        await asyncio.to_thread(usage_tracker.flush)
+    except Exception as e:
+        logger.warning("Failed to flush usage counters: %s", e)
     close_database()
-    print("[+] Application shutdown complete")
+    logger.info("Application shutdown complete")
+    stop_logging()
+
+# LLM provider: "openai" or "local" (llama.cpp on CPU, see local_llm.py)
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "openai")
+# Serve OpenAI failures and rate limits from the local model instead of erroring
+LLM_LOCAL_FALLBACK = os.getenv("LLM_LOCAL_FALLBACK", "false").lower() == "true"
+
+# Interval for batching streamed tokens into SSE events
+TOKEN_FLUSH_INTERVAL = 0.1
+# Interval for re-checking a queued generation's position
+QUEUE_POSITION_INTERVAL = 1.0
+
+# Controls of running generations by request fingerprint, see controlled_generation
+generation_controls: dict[str, GenerationControl] = {}
+
+# "compact" merges lines into paragraphs and collapses blank runs for smaller PDFs
+PDF_MODE = os.getenv("PDF_MODE", "standard")
 
 # Initialize OpenAI with LangChain
-def get_llm():
+def get_llm(model: str = "gpt-4o-mini", max_tokens: int = 16384, temperature: float = 0.8) -> Runnable:
+    if LLM_PROVIDER == "local":
+        from local_llm import LocalChatModel
+        return LocalChatModel(max_tokens=max_tokens, temperature=temperature)
+    
     api_key = os.getenv("OPENAI_API_KEY")
     if not api_key:
         raise ValueError("OPENAI_API_KEY environment variable is not set")
-    return ChatOpenAI(
-        model="gpt-4o-mini", 
-        temperature=0.8,
-        max_tokens=16384,
+    from langchain_openai import ChatOpenAI
+    llm = ChatOpenAI(
+        model=model, 
+        temperature=temperature,
+        max_tokens=max_tokens,
         api_key=api_key
     )
+    if LLM_LOCAL_FALLBACK:
+        from local_llm import LocalChatModel
+        return llm.with_fallbacks([LocalChatModel(max_tokens=max_tokens, temperature=temperature)])
+    return llm
 
 # Pydantic Models
 class SRSGenerationRequest(BaseModel):
@@ -90,18 +235,137 @@ class SRSGenerationRequest(BaseModel):
     selectedLanguage: Optional[str] = ""
     userId: Optional[str] = None  # MongoDB user ID
     username: Optional[str] = None  # Username for file storage
+    template: Optional[str] = None  # Prompt template name or "name@vN", see GET /prompt-templates
+    detailLevel: Optional[Literal["brief", "standard", "detailed"]] = None  # Output size hint; defaults to "standard"
+    streamTokens: Optional[bool] = False  # Forward generated text as "token" SSE events
+    reuseSimilar: Optional[bool] = False  # Reuse or edit a near-identical past SRS of this user
+    includeText: Optional[bool] = True  # False leaves the text out of the completion event; fetch it from textUrl
+    priority: Optional[Literal["interactive", "batch"]] = "interactive"  # Scheduling tier; batch work yields to interactive
+    pdfMode: Optional[Literal["standard", "compact"]] = None  # Defaults to PDF_MODE
+    localize: Optional[bool] = False  # Also translate the SRS into each language named in selectedLanguage...
+    languages: Optional[list[str]] = None  # ...or into exactly these languages, e.g. ["French", "German"]
 
 class PDFGenerationRequest(BaseModel):
     username: str
     text: str
     title: str
+    pdfMode: Optional[Literal["standard", "compact"]] = None  # Defaults to PDF_MODE
+
+class SectionRegenerationRequest(BaseModel):
+    username: str  # Username for file storage
+    instructions: Optional[str] = ""  # What to change in the section
+    detailLevel: Optional[Literal["brief", "standard", "detailed"]] = None
+    formats: Optional[list[Literal["pdf", "word"]]] = None  # Outputs to re-render; defaults to both
+    pdfMode: Optional[Literal["standard", "compact"]] = None  # Defaults to PDF_MODE
+
+class ProfileRequest(BaseModel):
+    mode: Literal["cpu", "memory", "both"] = "cpu"  # "cpu" samples stacks, "memory" traces allocations, "both" does both
+    seconds: Optional[float] = Field(None, gt=0, le=PROFILE_MAX_SECONDS)  # Profile for a time window...
+    generations: Optional[int] = Field(None, ge=1)  # ...or until this many more generations finish
+
+def get_prompt_template(name: Optional[str]) -> PromptTemplate:
+    """Resolve a prompt template by name, raising 400 for unknown templates"""
+    try:
+        return prompt_registry.get_public(name)
+    except KeyError as e:
+        raise HTTPException(status_code=400, detail=str(e.args[0]))
+
+def build_messages(template: PromptTemplate, request: SRSGenerationRequest, draft: Optional[str] = None, plan: Optional[dict] = None) -> list:
+    """Render the chat messages for an SRS request, following a drafted title and outline if given"""
+    fields = request.model_dump()
+    if draft:
+        fields["draft"] = draft
+    content = template.render(fields)
+    if plan:
+        content += plan_instruction(plan)
+    return [
+        SystemMessage(content=template.system),
+        HumanMessage(content=content)
+    ]
+
+async def translate_srs(title: str, text: str, expected: tuple[str, ...], languages: list[str], user: str) -> list:
+    """Translate a finished SRS into each language in parallel; a failed language comes back as its exception"""
+    llm = get_llm(MODEL_TIERS["light"], min(translation_budget(text, expected), MAX_OUTPUT_TOKENS), TRANSLATION_TEMPERATURE)
+    try:
+        await asyncio.to_thread(usage_tracker.check, user)
+        # One slot covers all of the request's translation calls, so they count towards the user's share
+        async with admission.slot(user, "batch", estimate_tokens(text) * len(languages) / 1000):
+            return await asyncio.gather(
+                *(translate_document(llm, title, text, language, user, expected) for language in languages),
+                return_exceptions=True
+            )
+    except (QuotaExceededError, QueueFullError) as e:
+        # The document itself is finished, so keep it and report every language as failed
+        return [e] * len(languages)
+
+def quota_user(user_id: Optional[str], username: Optional[str], client: Optional[str]) -> str:
+    """Key for quotas, fair queueing and drafts; anonymous callers are told apart by their address"""
+    return user_id or username or f"anonymous:{client or 'unknown'}"
+
+def client_address(connection: HTTPConnection) -> Optional[str]:
+    # Behind a proxy this is the forwarded address when uvicorn trusts the proxy (--forwarded-allow-ips)
+    return connection.client.host if connection.client else None
+
+async def find_plan(user: str, request: SRSGenerationRequest, template: PromptTemplate) -> Optional[dict]:
+    """Title and outline drafted by /srs-draft for this request, if still cached"""
+    try:
+        plan = await asyncio.to_thread(get_draft, draft_key(user, request.model_dump(), template.name))
+    except Exception as e:
+        logger.warning("Draft lookup failed: %s", e)
+        return None
+    metrics.incr("draft.hit" if plan else "draft.miss")
+    return plan
+
+def get_routed_llm(request: SRSGenerationRequest, template: PromptTemplate) -> tuple[Runnable, RoutingDecision]:
+    """Right-size the model and output budget for a request"""
+    decision = route_request(request.model_dump(), request.detailLevel, template.name)
+    llm = get_llm(decision.model, decision.max_tokens, decision.temperature)
+    if LLM_PROVIDER == "local":
+        decision.model = llm.model_name
+    return llm, decision
+
+async def complete_document(llm: Runnable, messages: list, template: PromptTemplate, user: str) -> str:
+    """Invoke the LLM, continuing a truncated or incomplete document up to MAX_CONTINUATIONS times"""
+    response = await llm.ainvoke(messages)
+    text = StrOutputParser().invoke(response)
+    usage_tracker.record(user, *response_usage(response, messages, text))
+    for _ in range(MAX_CONTINUATIONS):
+        continuation = plan_continuation(response.response_metadata.get("finish_reason"), text, template.sections)
+        if not continuation:
+            break
+        metrics.incr("continuation.rounds")
+        round_messages = continuation_messages(messages, text, continuation)
+        response = await llm.ainvoke(round_messages)
+        more = StrOutputParser().invoke(response)
+        usage_tracker.record(user, *response_usage(response, round_messages, more))
+        text = join_continuation(text, more, continuation.separator)
+    return text
 
 # Helper Functions
+def find_similar_srs(request: SRSGenerationRequest, k: int = 1) -> list[dict]:
+    """Nearest past SRS documents for this request, with relative file paths"""
+    matches = srs_index.search(request.model_dump(), request.userId, k)
+    for match in matches:
+        owner_dir = match.get("username") or ""
+        match["pdfPath"] = f"{owner_dir}/pdfs/{match.get('pdfName', '')}"
+        match["wordPath"] = f"{owner_dir}/docs/{match.get('wordName', '')}"
+    return matches
+
+def stored_files_exist(match: dict) -> bool:
+    """Check that both documents of an indexed SRS are still on disk"""
+    return all(
+        match.get(name) and (BASE_STORAGE_DIR / match[path]).is_file()
+        for name, path in (("pdfName", "pdfPath"), ("wordName", "wordPath"))
+    )
+
+def get_user_directory_paths(username: str) -> tuple[Path, Path]:
+    """Get user-specific PDF and Word directories without touching the filesystem"""
+    user_dir = BASE_STORAGE_DIR / username
+    return user_dir / "pdfs", user_dir / "docs"
+
 def get_user_directories(username: str) -> tuple[Path, Path]:
     """Get or create user-specific directories for PDFs and Word documents"""
-    user_dir = BASE_STORAGE_DIR / username
-    pdfs_dir = user_dir / "pdfs"
-    docs_dir = user_dir / "docs"
+    pdfs_dir, docs_dir = get_user_directory_paths(username)
     
     # Create directories if they don't exist
     pdfs_dir.mkdir(parents=True, exist_ok=True)
@@ -117,156 +381,69 @@ def sanitize_filename(filename: str) -> str:
     filename = re.sub(r'[^\w\-\.]', '_', filename)
     return filename
 
-def create_pdf(title: str, text: str, username: str) -> tuple[str, str]:
+def artifact_basename(username: str, job_id: Optional[str] = None) -> str:
+    """Build a collision-free file stem; the job id keeps same-second generations apart"""
+    timestamp = dt.datetime.now().strftime("%Y%m%d_%H%M%S")
+    job_id = sanitize_filename(job_id) if job_id else uuid.uuid4().hex[:12]
+    return f"{username}_{timestamp}_{job_id}"
+
+@contextmanager
+def atomic_output(filepath: Path):
+    """
+    Yield a temporary path next to filepath and rename it into place on success,
+    so readers never see a partially written document
+    """
+    tmp_path = filepath.with_name(f".{filepath.name}.{uuid.uuid4().hex}.tmp")
+    try:
+        yield tmp_path
+        os.replace(tmp_path, filepath)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+
+def create_pdf(title: str, text: str, username: str, job_id: Optional[str] = None, mode: Optional[str] = None) -> tuple[str, str]:
     """Generate PDF document using reportlab"""
     try:
         # Get user-specific directories
         pdfs_dir, _ = get_user_directories(username)
         
-        # Create filename with timestamp
-        timestamp = dt.datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"{username}_{timestamp}.pdf"
+        # Create a unique filename from the timestamp and job id
+        filename = f"{artifact_basename(username, job_id)}.pdf"
         filepath = pdfs_dir / filename
         
-        # Create PDF document
-        doc = SimpleDocTemplate(
-            str(filepath),
-            pagesize=letter,
-            rightMargin=72,
-            leftMargin=72,
-            topMargin=72,
-            bottomMargin=18,
-        )
-        
-        # Container for the 'Flowable' objects
-        elements = []
-        
-        # Define styles
-        styles = getSampleStyleSheet()
-        
-        # Title style
-        title_style = ParagraphStyle(
-            'CustomTitle',
-            parent=styles['Heading1'],
-            fontSize=24,
-            textColor='#1a1a1a',
-            spaceAfter=30,
-            alignment=TA_CENTER,
-            fontName='Helvetica-Bold'
-        )
-        
-        # Body style
-        body_style = ParagraphStyle(
-            'CustomBody',
-            parent=styles['BodyText'],
-            fontSize=11,
-            textColor='#333333',
-            alignment=TA_JUSTIFY,
-            spaceAfter=12,
-            fontName='Helvetica'
-        )
-        
-        # Heading style
-        heading_style = ParagraphStyle(
-            'CustomHeading',
-            parent=styles['Heading2'],
-            fontSize=14,
-            textColor='#1a1a1a',
-            spaceAfter=12,
-            spaceBefore=12,
-            fontName='Helvetica-Bold'
-        )
-        
-        # Add title
-        elements.append(Paragraph(title, title_style))
-        elements.append(Spacer(1, 0.2*inch))
-        
-        # Add metadata
-        # metadata = f"Generated by: {username}<br/>Date: {dt.datetime.now().strftime('%B %d, %Y')}"
-        # elements.append(Paragraph(metadata, styles['Normal']))
-        # elements.append(Spacer(1, 0.3*inch))
-        
-        # Process text content
-        # Split by newlines and process each line
-        lines = text.split('\n')
-        for line in lines:
-            line = line.strip()
-            if not line:
-                elements.append(Spacer(1, 0.1*inch))
-                continue
-            
-            # Check if line is a heading (starts with numbers like 1., 1.1, etc.)
-            if re.match(r'^\d+\.', line):
-                elements.append(Paragraph(line, heading_style))
-            else:
-                # Escape special characters for ReportLab
-                line = line.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
-                elements.append(Paragraph(line, body_style))
-        
-        # Build PDF
-        doc.build(elements)
+        # Build PDF into a temp file and move it into place atomically
+        with atomic_output(filepath) as tmp_path:
+            render_pdf(title, text, tmp_path, compact=(mode or PDF_MODE) == "compact")
         
         # Return both filename and relative path from username
         relative_path = f"{username}/pdfs/{filename}"
         return filename, relative_path
     except Exception as e:
-        print(f"Error creating PDF: {e}")
+        logger.exception("Error creating PDF")
         raise
 
-def create_word(title: str, text: str, username: str) -> tuple[str, str]:
-    """Generate Word document using python-docx"""
+def stored_file_size(relative_path: str) -> int:
+    """Size in bytes of a generated document"""
+    return (BASE_STORAGE_DIR / relative_path).stat().st_size
+
+def create_word(title: str, text: str, username: str, job_id: Optional[str] = None) -> tuple[str, str]:
+    """Generate Word document from the preloaded DOCX template"""
     try:
         # Get user-specific directories
         _, docs_dir = get_user_directories(username)
         
-        # Create filename with timestamp
-        timestamp = dt.datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"{username}_{timestamp}.docx"
+        # Create a unique filename from the timestamp and job id
+        filename = f"{artifact_basename(username, job_id)}.docx"
         filepath = docs_dir / filename
         
-        # Create Document
-        doc = Document()
-        
-        # Add title
-        title_para = doc.add_heading(title, level=0)
-        title_para.alignment = WD_ALIGN_PARAGRAPH.CENTER
-        
-        # Add metadata
-        # metadata_para = doc.add_paragraph()
-        # metadata_para.add_run(f"Generated by: {username}\n").bold = True
-        # metadata_para.add_run(f"Date: {dt.datetime.now().strftime('%B %d, %Y')}")
-        # metadata_para.alignment = WD_ALIGN_PARAGRAPH.CENTER
-        
-        doc.add_paragraph()  # Empty line
-        
-        # Process text content
-        lines = text.split('\n')
-        for line in lines:
-            line = line.strip()
-            if not line:
-                doc.add_paragraph()  # Empty line
-                continue
-            
-            # Check if line is a heading
-            if re.match(r'^\d+\.', line):
-                heading = doc.add_heading(line, level=1)
-                heading_format = heading.runs[0].font
-                heading_format.size = Pt(14)
-            else:
-                para = doc.add_paragraph(line)
-                para.alignment = WD_ALIGN_PARAGRAPH.JUSTIFY
-                para_format = para.runs[0].font if para.runs else None
-                if para_format:
-                    para_format.size = Pt(11)
-        
-        # Save document
-        doc.save(str(filepath))
+        # Render into a temp file and move it into place atomically
+        with atomic_output(filepath) as tmp_path:
+            render_docx(title, text, tmp_path)
         
         # Return both filename and relative path from username
         relative_path = f"{username}/docs/{filename}"
         return filename, relative_path
     except Exception as e:
-        print(f"Error creating Word document: {e}")
+        logger.exception("Error creating Word document")
         raise
 
 # API Routes
@@ -274,53 +451,199 @@ def create_word(title: str, text: str, username: str) -> tuple[str, str]:
 async def root():
     return {"message": "[+] Server up and running..."}
 
-@app.post("/generate-srs")
-async def generate_srs(request: SRSGenerationRequest):
-    """Generate SRS document using LangChain and OpenAI"""
+@app.get("/healthz")
+async def liveness():
+    """Liveness: the process is up and serving requests"""
+    return {"status": "alive"}
+
+@app.get("/readyz")
+async def readiness():
+    """Readiness: the database is connected and the heavy modules are loaded"""
+    return JSONResponse(
+        {"ready": profile.ready, "checks": profile.checks()},
+        status_code=200 if profile.ready else 503
+    )
+
+@app.get("/startup-profile")
+async def startup_profile():
+    """Timing of each startup import and init step"""
+    return profile.report()
+
+@app.get("/metrics")
+async def get_metrics():
+    """In-process counters and recent routing decisions, plus every worker's counters when state is shared"""
+    snapshot = metrics.snapshot()
+    snapshot["worker"] = os.getpid()
+    snapshot["admission"] = admission.snapshot()
+    if shared_store.shared:
+        snapshot["workers"] = await asyncio.to_thread(collect_worker_counters)
+    return snapshot
+
+def require_admin(http_request: Request):
+    """Reject requests without the admin token; the endpoints do not exist when none is configured"""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    token = http_request.headers.get("x-admin-token", "")
+    if not hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+
+@app.post("/admin/profile")
+async def start_profile(request: ProfileRequest, http_request: Request):
+    """Profile this worker for a time window or the next N generations"""
+    require_admin(http_request)
+    seconds = request.seconds if request.seconds or request.generations else 30.0
     try:
-        # Initialize LangChain
-        llm = get_llm()
-        output_parser = StrOutputParser()
-        
-        # Create the prompt
-        prompt = f"""
-        Generate a comprehensive Software Requirements Specification (SRS) document with the following details:
-        
-        Main Idea: {request.main}
-        Primary Purpose: {request.selectedPurpose}
-        Target Users: {request.selectedTarget}
-        Key Features: {request.selectedKeys}
-        Compatible Platforms: {request.selectedPlatforms}
-        Integration Requirements: {request.selectedIntegrations}
-        Performance Requirements: {request.selectedPerformance}
-        Security Requirements: {request.selectedSecurity}
-        Data Storage Capacity: {request.selectedStorage}
-        Operating Environment: {request.selectedEnvironment}
-        Language and Localization: {request.selectedLanguage}
-        
-        Please provide a suitable title for the software based on the main idea and write it like "Title: [title generated]" at the top of the text.
-        
-        Format the document with proper sections including:
-        1. Introduction
-        2. Overall Description
-        3. Specific Requirements
-        4. System Features
-        5. External Interface Requirements
-        6. Non-Functional Requirements
-        
-        Use newline characters for formatting. Do not use markdown hash symbols (#) for headings.
-        Write in a professional, technical style appropriate for an SRS document.
-        """
-        
-        # Create messages
+        session = profiler.start(request.mode, seconds, request.generations)
+    except ProfilerBusyError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return session.to_dict()
+
+@app.get("/admin/profile")
+async def profile_status(http_request: Request):
+    """The running session and the results of the last finished one"""
+    require_admin(http_request)
+    return profiler.status()
+
+@app.delete("/admin/profile")
+async def stop_profile(http_request: Request):
+    """Stop the running session early and return its results"""
+    require_admin(http_request)
+    session = await asyncio.to_thread(profiler.stop)
+    if session is None:
+        raise HTTPException(status_code=404, detail="No profiling session has run")
+    return session.to_dict()
+
+@app.get("/admin/profile/flamegraph")
+async def profile_flamegraph(http_request: Request):
+    """Collapsed stacks of the last finished CPU session, for flamegraph.pl or speedscope"""
+    require_admin(http_request)
+    session = profiler.last
+    if session is None or not session.cpu:
+        raise HTTPException(status_code=404, detail="No finished CPU profiling session")
+    return PlainTextResponse(session.collapsed())
+
+@app.post("/similar-srs")
+async def similar_srs(request: SRSGenerationRequest, k: int = Query(3, ge=1, le=20)):
+    """Find the user's past SRS documents closest to a request"""
+    try:
+        matches = await asyncio.to_thread(find_similar_srs, request, k)
+        return {"matches": matches}
+    except Exception as e:
+        logger.exception("Error searching similar SRS")
+        raise HTTPException(
+            status_code=500,
+            detail="An error occurred while searching similar SRS documents"
+        )
+
+@app.get("/usage/{user_id}")
+async def get_usage(user_id: str, days: int = Query(30, ge=1, le=366)):
+    """A user's token usage per day, today's and this month's totals, and the quotas"""
+    try:
+        if not usage_tracker.repo:
+            raise HTTPException(
+                status_code=503,
+                detail="Database is not available"
+            )
+        # Include this worker's unflushed usage
+        await asyncio.to_thread(usage_tracker.flush)
+        since = (dt.datetime.utcnow() - dt.timedelta(days=days - 1)).strftime("%Y-%m-%d")
+        history = await asyncio.to_thread(usage_tracker.repo.history, user_id, since)
+        totals = await asyncio.to_thread(usage_tracker.totals, user_id)
+        return {"userId": user_id, **totals, "quotas": usage_tracker.quotas(), "daily": history}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception("Error fetching usage")
+        raise HTTPException(
+            status_code=500,
+            detail="An error occurred while fetching usage"
+        )
+
+@app.get("/prompt-templates")
+async def list_prompt_templates():
+    """List the available prompt templates and their versions"""
+    return {"templates": [template.to_dict() for template in prompt_registry.list()]}
+
+@app.post("/srs-draft")
+async def draft_srs(request: SRSGenerationRequest, http_request: Request):
+    """
+    Draft the title and outline from a partly filled form.
+    The final generation uses them if main idea, purpose, target users and key
+    features are unchanged (see drafts.DRAFT_FIELDS), hiding that work behind form filling.
+    """
+    try:
+        template = get_prompt_template(request.template)
+        if not template.sections:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Template {template.name} has no sections to outline"
+            )
+        
+        user = quota_user(request.userId, request.username, client_address(http_request))
+        key = draft_key(user, request.model_dump(), template.name)
+        plan = await asyncio.to_thread(get_draft, key)
+        if plan:
+            metrics.incr("draft.cached")
+            return {**plan, "cached": True}
+        
+        await asyncio.to_thread(usage_tracker.check, user)
+        fields = request.model_dump()
+        fields["outline"] = "\n".join(f"{number}. {name}" for number, name in enumerate(template.sections, start=1))
+        outline_template = prompt_registry.get("outline")
         messages = [
-            SystemMessage(content="You are an expert technical writer specializing in Software Requirements Specification (SRS) documents. You generate comprehensive, well-structured SRS documents following IEEE 830 standards."),
-            HumanMessage(content=prompt)
+            SystemMessage(content=outline_template.system),
+            HumanMessage(content=outline_template.render(fields))
         ]
+        llm = get_llm(MODEL_TIERS["light"], DRAFT_MAX_TOKENS, DEFAULT_TEMPERATURE)
+        # Speculative work waits behind real generations
+        async with admission.slot(user, "batch"):
+            response = await llm.ainvoke(messages)
+        text = StrOutputParser().invoke(response)
+        usage_tracker.record(user, *response_usage(response, messages, text))
+        
+        plan = parse_plan(text)
+        if not plan["title"] or not plan["outline"]:
+            raise HTTPException(
+                status_code=502,
+                detail="The model did not return a usable outline"
+            )
+        await asyncio.to_thread(save_draft, key, plan)
+        metrics.incr("draft.generated")
+        return {**plan, "cached": False}
         
-        # Generate content
-        response = llm.invoke(messages)
-        generated_text = output_parser.invoke(response)
+    except HTTPException:
+        raise
+    except QueueFullError as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    except QuotaExceededError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except Exception as e:
+        logger.exception("Error drafting SRS outline")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error drafting SRS outline: {str(e)}"
+        )
+
+@app.post("/generate-srs")
+async def generate_srs(request: SRSGenerationRequest, http_request: Request):
+    """Generate SRS document using LangChain and OpenAI"""
+    try:
+        template = get_prompt_template(request.template)
+        
+        # Initialize LangChain with a model sized for the request
+        llm, routing = get_routed_llm(request, template)
+        
+        # Create messages from the selected prompt template
+        user = quota_user(request.userId, request.username, client_address(http_request))
+        messages = build_messages(template, request, plan=await find_plan(user, request, template))
+        
+        # Generate content without blocking the event loop, once a fair-queue slot is free
+        await asyncio.to_thread(usage_tracker.check, user)
+        async with admission.slot(user, request.priority or DEFAULT_TIER, routing.estimated_tokens / 1000):
+            try:
+                generated_text = await complete_document(llm, messages, template, user)
+            finally:
+                profiler.generation_finished()
         
         # Extract title
         title_match = re.search(r'Title:\s*(.*)', generated_text)
@@ -331,15 +654,32 @@ async def generate_srs(request: SRSGenerationRequest):
         # Remove the "Title:" line from the text
         modified_text = re.sub(r'Title:\s*.*\n?', '', generated_text, count=1)
         
-        return JSONResponse({
+        response = {
             "success": True,
             "title": title,
             "text": modified_text,
+            "promptVersion": template.key,
+            "model": routing.model,
             "message": "SRS generated successfully"
-        })
+        }
+        languages = requested_languages(request.selectedLanguage, request.languages) if request.localize else []
+        if languages:
+            results = await translate_srs(title, modified_text, template.sections, languages, user)
+            response["translations"] = [
+                {"language": language, "error": str(result)} if isinstance(result, Exception)
+                else {"language": language, "title": result[0], "text": result[1], "truncated": result[2]}
+                for language, result in zip(languages, results)
+            ]
+        return compressed_json_response(http_request, response)
         
+    except HTTPException:
+        raise
+    except QueueFullError as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    except QuotaExceededError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
     except Exception as e:
-        print(f"Error generating SRS: {e}")
+        logger.exception("Error generating SRS")
         raise HTTPException(
             status_code=500,
             detail=f"Error generating SRS: {str(e)}"
@@ -355,11 +695,14 @@ async def generate_pdf(request: PDFGenerationRequest):
                 detail="Username is required"
             )
         
+        # Shared job id so the PDF and Word document get matching names
+        job_id = uuid.uuid4().hex[:12]
+        
         # Generate PDF
-        pdf_filename, pdf_path = create_pdf(request.title, request.text, request.username)
+        pdf_filename, pdf_path = await asyncio.to_thread(create_pdf, request.title, request.text, request.username, job_id, request.pdfMode)
         
         # Generate Word document
-        word_filename, word_path = create_word(request.title, request.text, request.username)
+        word_filename, word_path = await asyncio.to_thread(create_word, request.title, request.text, request.username, job_id)
         
         return JSONResponse({
             "success": True,
@@ -367,92 +710,465 @@ async def generate_pdf(request: PDFGenerationRequest):
             "wordName": word_filename,
             "pdfPath": pdf_path,
             "wordPath": word_path,
+            "pdfSize": stored_file_size(pdf_path),
             "message": "Documents generated successfully"
         })
         
     except Exception as e:
-        print(f"Error generating documents: {e}")
+        logger.exception("Error generating documents")
         raise HTTPException(
             status_code=500,
             detail=f"Error generating documents: {str(e)}"
         )
 
+@app.get("/srs/{srs_id}/text")
+async def get_srs_text(srs_id: str, request: Request, section: Optional[int] = Query(None, ge=1)):
+    """Fetch the stored SRS text and section outline, or a single section"""
+    try:
+        if not srs_repo:
+            raise HTTPException(
+                status_code=503,
+                detail="Database is not available"
+            )
+        
+        stored = await asyncio.to_thread(srs_repo.find_text, srs_id) if ObjectId.is_valid(srs_id) else None
+        if not stored or not stored["text"]:
+            raise HTTPException(
+                status_code=404,
+                detail="SRS text not found"
+            )
+        
+        if section is not None:
+            _, sections = parse_sections(stored["text"], template_sections(stored["promptVersion"]))
+            found = find_section(sections, section)
+            if not found:
+                raise HTTPException(
+                    status_code=404,
+                    detail=f"Section {section} not found"
+                )
+            payload = {"srsId": srs_id, "title": stored["title"], "section": found.to_dict()}
+        else:
+            payload = {
+                "srsId": srs_id,
+                "title": stored["title"],
+                "text": stored["text"],
+                "sections": stored["sections"]
+            }
+        # Section edits change the text, so clients revalidate with the ETag
+        return compressed_json_response(request, payload, cache_control="private, no-cache")
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception("Error fetching SRS text")
+        raise HTTPException(
+            status_code=500,
+            detail="An error occurred while fetching the SRS text"
+        )
+
+@app.post("/srs/{srs_id}/sections/{section_number}/regenerate")
+async def regenerate_section(srs_id: str, section_number: int, request: SectionRegenerationRequest, http_request: Request):
+    """Rewrite one section of a stored SRS and re-render only the requested outputs"""
+    try:
+        result = await rewrite_section(srs_id, section_number, request)
+        return compressed_json_response(http_request, result)
+        
+    except HTTPException:
+        raise
+    except QueueFullError as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    except QuotaExceededError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except Exception as e:
+        logger.exception("Error regenerating section")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error regenerating section: {str(e)}"
+        )
+
+async def rewrite_section(srs_id: str, section_number: int, request: SectionRegenerationRequest) -> dict:
+    """Regenerate a section and store the result; shared by the HTTP and WebSocket endpoints"""
+    job_id_var.set(srs_id)
+    if not srs_repo:
+        raise HTTPException(
+            status_code=503,
+            detail="Database is not available"
+        )
+    
+    srs = await asyncio.to_thread(srs_repo.find_by_id, srs_id) if ObjectId.is_valid(srs_id) else None
+    if not srs:
+        raise HTTPException(
+            status_code=404,
+            detail="SRS not found"
+        )
+    
+    # Older records only have their text in the similarity index
+    text = srs.text or await asyncio.to_thread(srs_index.get_text, srs_id)
+    if not text:
+        raise HTTPException(
+            status_code=409,
+            detail="The text of this SRS is not stored; regenerate the full document instead"
+        )
+    
+    prompt_version = srs.prompt_version or LEGACY_PROMPT_VERSION
+    preamble, sections = parse_sections(text, template_sections(prompt_version))
+    section = find_section(sections, section_number)
+    if not section:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Section {section_number} not found"
+        )
+    
+    # Rebuild the prompt context from the stored request fields
+    try:
+        fields = dict(zip(FIELD_NAMES, json.loads(srs.description)))
+    except ValueError:
+        fields = {}
+    fields.update({
+        "title": srs.name,
+        "outline": "\n".join(s.heading for s in sections),
+        "sectionText": section.text,
+        "instructions": request.instructions or "Improve clarity and completeness."
+    })
+    template = prompt_registry.get("section")
+    messages = [
+        SystemMessage(content=template.system),
+        HumanMessage(content=template.render(fields))
+    ]
+    
+    routing = route_section(section.text, request.detailLevel)
+    llm = get_llm(routing.model, routing.max_tokens, routing.temperature)
+    # The owner is the userId the SRS was generated under, the same key generations use
+    user = srs.owner or request.username or "anonymous"
+    await asyncio.to_thread(usage_tracker.check, user)
+    async with admission.slot(user, DEFAULT_TIER, routing.estimated_tokens / 1000):
+        response = await llm.ainvoke(messages)
+    rewritten = StrOutputParser().invoke(response)
+    usage_tracker.record(user, *response_usage(response, messages, rewritten))
+    body = strip_heading(rewritten)
+    
+    # Re-render only what was asked for; new names keep cached downloads valid
+    safe_username = sanitize_filename(request.username)
+    formats = request.formats or ["pdf", "word"]
+    for _ in range(SECTION_WRITE_ATTEMPTS):
+        section.body = body
+        new_text = assemble_sections(preamble, sections)
+        job_id = uuid.uuid4().hex[:12]
+        updates = {"text": new_text, "prompt_version": prompt_version}
+        result = {
+            "success": True,
+            "srsId": srs_id,
+            "title": srs.name,
+            "sectionNumber": section.number,
+            "sectionText": section.text,
+            "text": new_text,
+            "pdfName": srs.pdf_url,
+            "wordName": srs.word_url,
+            "message": f"Section {section.number} regenerated successfully"
+        }
+        rendered = []
+        if "pdf" in formats:
+            pdf_filename, pdf_path = await asyncio.to_thread(create_pdf, srs.name, new_text, safe_username, job_id, request.pdfMode)
+            updates["pdf_url"] = result["pdfName"] = pdf_filename
+            result["pdfPath"] = pdf_path
+            result["pdfSize"] = stored_file_size(pdf_path)
+            rendered.append(pdf_path)
+        if "word" in formats:
+            word_filename, word_path = await asyncio.to_thread(create_word, srs.name, new_text, safe_username, job_id)
+            updates["word_url"] = result["wordName"] = word_filename
+            result["wordPath"] = word_path
+            rendered.append(word_path)
+        
+        # Only written if no other edit landed while this one was generated
+        if await asyncio.to_thread(srs_repo.update, srs_id, updates, (), srs.revision):
+            break
+        
+        # Another section was rewritten meanwhile: put this section into the latest text and try again
+        metrics.incr("sections.conflicts")
+        for path in rendered:
+            (BASE_STORAGE_DIR / path).unlink(missing_ok=True)
+        srs = await asyncio.to_thread(srs_repo.find_by_id, srs_id)
+        preamble, sections = parse_sections(srs.text if srs else "", template_sections(prompt_version))
+        section = find_section(sections, section_number)
+        if not section:
+            raise HTTPException(
+                status_code=409,
+                detail=f"Section {section_number} changed while it was being rewritten; try again"
+            )
+    else:
+        raise HTTPException(
+            status_code=409,
+            detail="The SRS kept changing while the section was rewritten; try again"
+        )
+    
+    # Similar-SRS reuse must serve the edited text and files, not the originals
+    try:
+        changes = {name: result[name] for name in ("pdfName", "wordName")}
+        await asyncio.to_thread(srs_index.update, srs_id, new_text, changes)
+    except Exception as index_error:
+        logger.warning("Similarity index error: %s", index_error)
+    return result
+
 @app.get("/download-pdf/{username}/{filename}")
-async def download_pdf(username: str, filename: str):
+async def download_pdf(username: str, filename: str, request: Request):
     """Download PDF file from user's directory"""
     try:
         # Sanitize inputs
         safe_username = sanitize_filename(username)
         safe_filename = sanitize_filename(filename)
         
-        pdfs_dir, _ = get_user_directories(safe_username)
+        # Read path only: never create directories for a download
+        pdfs_dir, _ = get_user_directory_paths(safe_username)
         filepath = pdfs_dir / safe_filename
         
-        if not filepath.exists():
+        try:
+            return await conditional_file_response(
+                request,
+                filepath,
+                safe_filename,
+                'application/pdf'
+            )
+        except FileNotFoundError:
             raise HTTPException(
                 status_code=404,
                 detail="PDF file not found"
             )
-        
-        return FileResponse(
-            path=str(filepath),
-            filename=safe_filename,
-            media_type='application/pdf'
-        )
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error downloading PDF: {e}")
+        logger.exception("Error downloading PDF")
         raise HTTPException(
             status_code=500,
             detail="An error occurred while downloading the PDF file"
         )
 
 @app.get("/download-word/{username}/{filename}")
-async def download_word(username: str, filename: str):
+async def download_word(username: str, filename: str, request: Request):
     """Download Word document from user's directory"""
     try:
         # Sanitize inputs
         safe_username = sanitize_filename(username)
         safe_filename = sanitize_filename(filename)
         
-        _, docs_dir = get_user_directories(safe_username)
+        # Read path only: never create directories for a download
+        _, docs_dir = get_user_directory_paths(safe_username)
         filepath = docs_dir / safe_filename
         
-        if not filepath.exists():
+        try:
+            return await conditional_file_response(
+                request,
+                filepath,
+                safe_filename,
+                'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+            )
+        except FileNotFoundError:
             raise HTTPException(
                 status_code=404,
                 detail="Word document not found"
             )
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception("Error downloading Word document")
+        raise HTTPException(
+            status_code=500,
+            detail="An error occurred while downloading the Word document"
+        )
+
+def list_bundle_entries(username: str, filenames: list[str]) -> list[tuple[Path, str]]:
+    """Resolve selected (or, when empty, all) stored artifacts of a user to zip entries"""
+    pdfs_dir, docs_dir = get_user_directory_paths(username)
+    
+    if not filenames:
+        entries = []
+        for directory in (pdfs_dir, docs_dir):
+            if directory.is_dir():
+                entries.extend(
+                    (path, f"{directory.name}/{path.name}")
+                    for path in sorted(directory.iterdir())
+                    if path.is_file() and not path.name.startswith(".")
+                )
+        return entries
+    
+    entries = []
+    for filename in dict.fromkeys(filenames):
+        safe_filename = sanitize_filename(filename)
+        directory = pdfs_dir if safe_filename.lower().endswith(".pdf") else docs_dir
+        filepath = directory / safe_filename
+        if filepath.is_file():
+            entries.append((filepath, f"{directory.name}/{safe_filename}"))
+    return entries
+
+@app.get("/download-bundle/{username}")
+async def download_bundle(
+    username: str,
+    files: Optional[list[str]] = Query(None),
+    srsIds: Optional[list[str]] = Query(None)
+):
+    """Stream a ZIP of a user's selected (or all) SRS documents in one transfer"""
+    try:
+        safe_username = sanitize_filename(username)
+        filenames = list(files or [])
+        
+        # Expand SRS record IDs into their stored PDF and Word file names
+        if srsIds:
+            if not srs_repo:
+                raise HTTPException(
+                    status_code=503,
+                    detail="Database is not available"
+                )
+            invalid = [srs_id for srs_id in srsIds if not ObjectId.is_valid(srs_id)]
+            if invalid:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"Invalid SRS id: {', '.join(invalid)}"
+                )
+            for srs_id in srsIds:
+                srs = await asyncio.to_thread(srs_repo.find_by_id, srs_id)
+                if srs and srs.status == "Completed":
+                    filenames.extend(name for name in (srs.pdf_url, srs.word_url) if name)
+            if not filenames:
+                raise HTTPException(
+                    status_code=404,
+                    detail="No documents found for the selected SRS records"
+                )
+        
+        entries = await asyncio.to_thread(list_bundle_entries, safe_username, filenames)
+        if not entries:
+            raise HTTPException(
+                status_code=404,
+                detail="No documents found"
+            )
         
-        return FileResponse(
-            path=str(filepath),
-            filename=safe_filename,
-            media_type='application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+        return StreamingResponse(
+            iter_zip(entries),
+            media_type="application/zip",
+            headers={
+                "Content-Disposition": f'attachment; filename="{safe_username}_srs_bundle.zip"'
+            }
         )
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error downloading Word document: {e}")
+        logger.exception("Error creating download bundle")
         raise HTTPException(
             status_code=500,
-            detail="An error occurred while downloading the Word document"
+            detail="An error occurred while creating the download bundle"
         )
 
-async def srs_generation_stream(request: SRSGenerationRequest) -> AsyncGenerator[str, None]:
+async def srs_generation_stream(
+    request: SRSGenerationRequest,
+    resume: Optional[dict] = None,
+    control: Optional[GenerationControl] = None,
+    client: Optional[str] = None
+) -> AsyncGenerator[str, None]:
     """
     Generator function for Server-Sent Events
     Streams progress updates during SRS generation
+    With resume (see recover_stale_generations) it finishes an interrupted record instead
+    control carries requests made by WebSocket clients while it runs
+    client is the caller's address, which tells anonymous callers apart
     """
-    srs_id = None
+    srs_id = resume["srsId"] if resume else None
+    if resume:
+        client = resume.get("client")
+    heartbeat = None
+    if srs_id:
+        job_id_var.set(srs_id)
+    ticket = None
     try:
         # Send initial status
         yield f"data: {json.dumps({'status': 'initiated', 'message': 'Starting SRS generation...'})}\n\n"
         await asyncio.sleep(0.1)  # Small delay to ensure message is sent
+        # Resolve the prompt template before doing any work
+        template = prompt_registry.get_public(request.template)
+        requested_template = template.name
+        
         # Determine username for file storage
         username = request.username
         user_id = request.userId
         
+        # Offer a near-identical earlier SRS instantly, or use a similar one as a draft
+        draft_text = None
+        draft_from = None
+        if resume:
+            template = prompt_registry.get(resume["template"])
+            draft_from = resume.get("draftFrom")
+            if draft_from:
+                draft_text = await asyncio.to_thread(srs_index.get_text, draft_from)
+        elif request.reuseSimilar:
+            matches = await asyncio.to_thread(find_similar_srs, request)
+            match = matches[0] if matches else None
+            
+            if (match and match["score"] >= REUSE_THRESHOLD
+                    and match.get("template") == template.name
+                    and await asyncio.to_thread(stored_files_exist, match)):
+                metrics.incr("similarity.reused")
+                reused_text = await asyncio.to_thread(srs_index.get_text, match["srsId"])
+                yield f"data: {json.dumps({'status': 'processing', 'message': 'Found a matching SRS you generated earlier...'})}\n\n"
+                completion_data = {
+                    'status': 'completed',
+                    'message': 'SRS generation completed successfully!',
+                    'title': match.get('title', ''),
+                    'pdfName': match['pdfName'],
+                    'wordName': match['wordName'],
+                    'pdfPath': match['pdfPath'],
+                    'wordPath': match['wordPath'],
+                    'text': reused_text or '',
+                    'promptVersion': match.get('promptVersion'),
+                    'srsId': match['srsId'],
+                    'reusedFrom': match['srsId'],
+                    'similarity': match['score']
+                }
+                if not request.includeText:
+                    del completion_data['text']
+                    completion_data['textUrl'] = f"/srs/{match['srsId']}/text"
+                yield f"data: {json.dumps(completion_data)}\n\n"
+                yield "event: close\ndata: {}\n\n"
+                return
+            
+            # The edit prompt keeps the draft's layout in its own fixed sections, so only a
+            # document of the same template, with those sections, can be revised
+            edit_template = prompt_registry.get("edit")
+            if (match and match["score"] >= DRAFT_THRESHOLD
+                    and match.get("template") == template.name
+                    and template.sections == edit_template.sections):
+                draft_text = await asyncio.to_thread(srs_index.get_text, match["srsId"])
+                if draft_text:
+                    metrics.incr("similarity.drafted")
+                    draft_from = match["srsId"]
+                    template = edit_template
+                    yield f"data: {json.dumps({'status': 'processing', 'message': 'Using a similar earlier SRS as a starting draft...'})}\n\n"
+        
+        # Wait for a generation slot; the queue is fair across users and tiers
+        llm, routing = get_routed_llm(request, template)
+        user = quota_user(user_id, username, client)
+        # Reuse a title and outline drafted while the form was filled in; not
+        # for edits of a similar SRS, or a resumed run that already has its text
+        plan = None
+        if not resume and not draft_text:
+            plan = await find_plan(user, request, template)
+            if plan:
+                message = f"Using the drafted outline for: {plan['title']}"
+                yield f"data: {json.dumps({'status': 'processing', 'message': message, 'title': plan['title']})}\n\n"
+        if not resume:
+            # A resumed generation was already admitted by the process that died
+            await asyncio.to_thread(usage_tracker.check, user)
+        ticket = admission.enqueue(
+            user,
+            request.priority or DEFAULT_TIER,
+            routing.estimated_tokens / 1000
+        )
+        last_position = None
+        while not ticket.granted.is_set():
+            position = admission.position(ticket)
+            if position != last_position:
+                yield f"data: {json.dumps({'status': 'queued', 'message': f'Waiting in queue (position {position})...', 'position': position})}\n\n"
+                last_position = position
+            try:
+                await asyncio.wait_for(ticket.granted.wait(), QUEUE_POSITION_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+        
         # Create description array similar to Next.js implementation
         description_array = [
             request.main,
@@ -469,7 +1185,7 @@ async def srs_generation_stream(request: SRSGenerationRequest) -> AsyncGenerator
         ]
         
         # Save initial SRS document to database with "Processing" status
-        if srs_repo:
+        if srs_repo and not srs_id:
             try:
                 initial_srs = SRSDocument(
                     owner=user_id,
@@ -480,61 +1196,108 @@ async def srs_generation_stream(request: SRSGenerationRequest) -> AsyncGenerator
                     word_url=""
                 )
                 srs_id = srs_repo.create(initial_srs)
+                job_id_var.set(srs_id)
+                # Everything needed to resume the generation if this process dies
+                srs_repo.update(srs_id, {"job": {
+                    "request": request.model_dump(),
+                    "template": template.key,
+                    "draftFrom": draft_from,
+                    "client": client,
+                    "attempts": 0
+                }})
                 yield f"data: {json.dumps({'status': 'processing', 'message': 'SRS record created in database...'})}\n\n"
                 await asyncio.sleep(0.1)  # Ensure message is flushed
             except Exception as db_error:
-                print(f"Database error: {db_error}")
+                logger.warning("Database error: %s", db_error)
                 # Continue even if database save fails
                 pass
+        if srs_repo and srs_id:
+            heartbeat = asyncio.create_task(keep_alive(srs_id))
         
         # Initialize LangChain
         yield f"data: {json.dumps({'status': 'processing', 'message': 'Initializing AI model...'})}\n\n"
         await asyncio.sleep(0.1)  # Ensure message is flushed
         
-        llm = get_llm()
-        output_parser = StrOutputParser()
-        
-        # Create the prompt
-        prompt = f"""
-        Generate a comprehensive Software Requirements Specification (SRS) document with the following details:
-        
-        Main Idea: {request.main}
-        Primary Purpose: {request.selectedPurpose}
-        Target Users: {request.selectedTarget}
-        Key Features: {request.selectedKeys}
-        Compatible Platforms: {request.selectedPlatforms}
-        Integration Requirements: {request.selectedIntegrations}
-        Performance Requirements: {request.selectedPerformance}
-        Security Requirements: {request.selectedSecurity}
-        Data Storage Capacity: {request.selectedStorage}
-        Operating Environment: {request.selectedEnvironment}
-        Language and Localization: {request.selectedLanguage}
-        
-        Please provide a suitable title for the software based on the main idea and write it like "Title: [title generated]" at the top of the text.
-        
-        Format the document with proper sections including:
-        1. Introduction
-        2. Overall Description
-        3. Specific Requirements
-        4. System Features
-        5. External Interface Requirements
-        6. Non-Functional Requirements
-        
-        Use newline characters for formatting. Do not use markdown hash symbols (#) for headings.
-        Write in a professional, technical style appropriate for an SRS document.
-        """
-        
         # Generate content
         yield f"data: {json.dumps({'status': 'processing', 'message': 'Generating SRS content with AI...'})}\n\n"
         await asyncio.sleep(0.1)  # Ensure message is flushed before long AI call
         
-        messages = [
-            SystemMessage(content="You are an expert technical writer specializing in Software Requirements Specification (SRS) documents. You generate comprehensive, well-structured SRS documents following IEEE 830 standards."),
-            HumanMessage(content=prompt)
-        ]
+        messages = build_messages(template, request, draft_text, plan)
+        
+        # Stream the completion so the event loop stays free; tokens are
+        # forwarded in small batches when the client asked for them
+        generated_text = resume["text"] if resume else ""
+        round_messages = messages
+        continuation = None
+        if generated_text:
+            # Carry on from the last checkpoint of the interrupted run
+            continuation = Continuation(CONTINUE_INSTRUCTION, "")
+            round_messages = continuation_messages(messages, generated_text, continuation)
+        loop = asyncio.get_running_loop()
+        last_checkpoint = loop.time()
+        # A run that died while rendering already has the whole text
+        rounds = 0 if resume and resume.get("stage") == "rendering" else MAX_CONTINUATIONS + 1
+        summarizing = False
+        round_number = 0
+        while round_number < rounds:
+            parts = []
+            pending_tokens = []
+            finish_reason = None
+            usage_chunk = None
+            switch_to_summary = False
+            last_flush = loop.time()
+            stream = llm.astream(round_messages)
+            async for chunk in stream:
+                finish_reason = chunk.response_metadata.get("finish_reason") or finish_reason
+                if getattr(chunk, "usage_metadata", None):
+                    usage_chunk = chunk
+                if not chunk.content:
+                    continue
+                parts.append(chunk.content)
+                if request.streamTokens:
+                    pending_tokens.append(chunk.content)
+                if control and control.summary and not summarizing:
+                    # Stop this completion and have the model finish briefly from here
+                    switch_to_summary = True
+                    break
+                if pending_tokens and loop.time() - last_flush >= TOKEN_FLUSH_INTERVAL:
+                    yield f"data: {json.dumps({'status': 'token', 'token': ''.join(pending_tokens)})}\n\n"
+                    pending_tokens.clear()
+                    last_flush = loop.time()
+                if srs_repo and srs_id and loop.time() - last_checkpoint >= CHECKPOINT_INTERVAL:
+                    partial = join_continuation(generated_text, "".join(parts), continuation.separator) if continuation else "".join(parts)
+                    await checkpoint_generation(srs_id, "generating", partial)
+                    last_checkpoint = loop.time()
+            # Closes the LLM stream early if the loop was left with a break
+            await stream.aclose()
+            if pending_tokens:
+                yield f"data: {json.dumps({'status': 'token', 'token': ''.join(pending_tokens)})}\n\n"
+            usage_tracker.record(user, *response_usage(usage_chunk, round_messages, "".join(parts)))
+            
+            # Pick up a truncated or incomplete document where it stopped instead of starting over
+            if continuation:
+                generated_text = join_continuation(generated_text, "".join(parts), continuation.separator)
+            else:
+                generated_text = "".join(parts)
+            if switch_to_summary:
+                summarizing = True
+                continuation = Continuation(SUMMARY_INSTRUCTION, "")
+                yield f"data: {json.dumps({'status': 'processing', 'message': 'Switching to summary mode...'})}\n\n"
+                round_messages = continuation_messages(messages, generated_text, continuation)
+                # The summary round does not count against MAX_CONTINUATIONS, so it runs even
+                # when the switch comes during the last round
+                continue
+            continuation = plan_continuation(finish_reason, generated_text, template.sections)
+            if not continuation or round_number == MAX_CONTINUATIONS:
+                break
+            round_number += 1
+            metrics.incr("continuation.rounds")
+            reason = "was cut off" if finish_reason == "length" else "is missing sections"
+            yield f"data: {json.dumps({'status': 'processing', 'message': f'The document {reason}, continuing...'})}\n\n"
+            round_messages = continuation_messages(messages, generated_text, continuation)
         
-        response = llm.invoke(messages)
-        generated_text = output_parser.invoke(response)
+        if srs_repo and srs_id:
+            await checkpoint_generation(srs_id, "rendering", generated_text)
         
         # Extract title
         yield f"data: {json.dumps({'status': 'processing', 'message': 'Processing generated content...'})}\n\n"
@@ -547,37 +1310,99 @@ async def srs_generation_stream(request: SRSGenerationRequest) -> AsyncGenerator
         # Remove the "Title:" line from the text
         modified_text = re.sub(r'Title:\s*.*\n?', '', generated_text, count=1)
         
+        # Render anyway, but tell the client what is still missing
+        missing = missing_sections(modified_text, template.sections)
+        if missing:
+            metrics.incr("continuation.incomplete")
+            logger.warning("SRS rendered without sections: %s", ", ".join(missing))
+        
         yield f"data: {json.dumps({'status': 'processing', 'message': f'SRS generated: {title}', 'title': title})}\n\n"
         await asyncio.sleep(0.1)  # Ensure message is flushed
         
+        # Name both files after the record so concurrent generations never collide
+        job_id = srs_id or uuid.uuid4().hex[:12]
+        
         # Generate PDF
         yield f"data: {json.dumps({'status': 'processing', 'message': 'Creating PDF document...'})}\n\n"
         await asyncio.sleep(0.1)  # Ensure message is flushed
         
-        pdf_filename, pdf_path = create_pdf(title, modified_text, username)
+        pdf_filename, pdf_path = await asyncio.to_thread(create_pdf, title, modified_text, username, job_id, request.pdfMode)
         
         # Generate Word document
         yield f"data: {json.dumps({'status': 'processing', 'message': 'Creating Word document...'})}\n\n"
         await asyncio.sleep(0.1)  # Ensure message is flushed
         
-        word_filename, word_path = create_word(title, modified_text, username)
+        word_filename, word_path = await asyncio.to_thread(create_word, title, modified_text, username, job_id)
+        
+        # Translate the finished document section by section instead of generating it again per language
+        translations = []
+        languages = requested_languages(request.selectedLanguage, request.languages) if request.localize else []
+        if languages:
+            # The generation is done; translations wait for their own batch-tier slot
+            admission.release(ticket)
+            ticket = None
+            message = f"Translating into {', '.join(languages)}..."
+            yield f"data: {json.dumps({'status': 'processing', 'message': message, 'languages': languages})}\n\n"
+            results = await translate_srs(title, modified_text, template.sections, languages, user)
+            for language, result in zip(languages, results):
+                if isinstance(result, Exception):
+                    logger.warning("Translation into %s failed: %s", language, result)
+                    translations.append({"language": language, "error": str(result)})
+                    continue
+                translated_title, translated_text, truncated = result
+                suffix = f"{job_id}_{sanitize_filename(language.lower().replace(' ', '-'))}"
+                translated_pdf, translated_pdf_path = await asyncio.to_thread(create_pdf, translated_title, translated_text, username, suffix, request.pdfMode)
+                translated_word, translated_word_path = await asyncio.to_thread(create_word, translated_title, translated_text, username, suffix)
+                translations.append({
+                    "language": language,
+                    "title": translated_title,
+                    "pdfName": translated_pdf,
+                    "wordName": translated_word,
+                    "pdfPath": translated_pdf_path,
+                    "wordPath": translated_word_path,
+                    "pdfSize": stored_file_size(translated_pdf_path),
+                    "truncated": truncated
+                })
+            yield f"data: {json.dumps({'status': 'processing', 'message': 'Translated documents created...'})}\n\n"
         
         # Update database with completion status and file URLs
         if srs_repo and srs_id:
             try:
-                srs_repo.update(srs_id, {
+                updates = {
                     "name": title,
                     "status": "Completed",
+                    "prompt_version": template.key,
+                    "text": modified_text,
                     "pdf_url": pdf_filename,  # Store just filename like Next.js
                     "word_url": word_filename
-                })
+                }
+                if translations:
+                    updates["translations"] = [
+                        {"language": t["language"], "title": t["title"], "pdf_url": t["pdfName"], "word_url": t["wordName"], "truncated": t["truncated"]}
+                        for t in translations if "error" not in t
+                    ]
+                srs_repo.update(srs_id, updates, unset=CHECKPOINT_FIELDS)
                 yield f"data: {json.dumps({'status': 'processing', 'message': 'Database updated with generated files...'})}\n\n"
                 await asyncio.sleep(0.1)  # Ensure message is flushed
             except Exception as db_error:
-                print(f"Database update error: {db_error}")
+                logger.warning("Database update error: %s", db_error)
                 # Continue even if database update fails
                 pass
         
+        # Index the finished document for similarity lookups
+        try:
+            await asyncio.to_thread(srs_index.add, job_id, request.model_dump(), modified_text, {
+                "owner": user_id,
+                "username": username,
+                "title": title,
+                "template": requested_template,
+                "promptVersion": template.key,
+                "pdfName": pdf_filename,
+                "wordName": word_filename
+            })
+        except Exception as index_error:
+            logger.warning("Similarity index error: %s", index_error)
+        
         # Send completion event with file information
         completion_data = {
             'status': 'completed',
@@ -587,14 +1412,45 @@ async def srs_generation_stream(request: SRSGenerationRequest) -> AsyncGenerator
             'wordName': word_filename,
             'pdfPath': pdf_path,
             'wordPath': word_path,
+            'pdfSize': stored_file_size(pdf_path),
             'text': modified_text,
+            'promptVersion': template.key,
+            'model': routing.model,
             'srsId': srs_id  # Include database ID
         }
+        if missing:
+            completion_data['missingSections'] = missing
+        if translations:
+            completion_data['translations'] = translations
+        # Large payload: clients that fetch the text separately can skip it here
+        if not request.includeText and srs_id:
+            del completion_data['text']
+            completion_data['textUrl'] = f"/srs/{srs_id}/text"
         yield f"data: {json.dumps(completion_data)}\n\n"
         
         # Send close event
         yield "event: close\ndata: {}\n\n"
         
+    except asyncio.CancelledError:
+        # Every client disconnected (see singleflight.DISCONNECT_POLICY); the LLM
+        # stream is closed as the cancellation unwinds and rendering never starts.
+        # At shutdown the record stays "Processing" for the next process to resume
+        if srs_repo and srs_id and not shutting_down:
+            try:
+                srs_repo.update(srs_id, {
+                    "status": "Cancelled",
+                    "pdf_url": "No PDF",
+                    "word_url": "No Docx"
+                }, unset=CHECKPOINT_FIELDS)
+            except Exception as db_error:
+                logger.warning("Database error during cancellation: %s", db_error)
+        raise
+        
+    except QuotaExceededError as e:
+        # Checked before the record is created, so there is nothing to update
+        yield f"data: {json.dumps({'status': 'error', 'message': str(e), 'retryAfter': e.retry_after})}\n\n"
+        yield "event: close\ndata: {}\n\n"
+        
     except Exception as e:
         # Update database with failed status if SRS was created
         if srs_repo and srs_id:
@@ -603,9 +1459,9 @@ async def srs_generation_stream(request: SRSGenerationRequest) -> AsyncGenerator
                     "status": "Failed",
                     "pdf_url": "No PDF",
                     "word_url": "No Docx"
-                })
+                }, unset=CHECKPOINT_FIELDS)
             except Exception as db_error:
-                print(f"Database error during failure handling: {db_error}")
+                logger.warning("Database error during failure handling: %s", db_error)
         
         error_data = {
             'status': 'error',
@@ -613,24 +1469,201 @@ async def srs_generation_stream(request: SRSGenerationRequest) -> AsyncGenerator
         }
         yield f"data: {json.dumps(error_data)}\n\n"
         yield "event: close\ndata: {}\n\n"
+    
+    finally:
+        if heartbeat:
+            heartbeat.cancel()
+        if ticket:
+            admission.release(ticket)
+        profiler.generation_finished()
+
+async def controlled_generation(
+    key: str, request: SRSGenerationRequest, resume: Optional[dict] = None, client: Optional[str] = None
+) -> AsyncGenerator[str, None]:
+    """Run a generation with a control that WebSocket clients can reach through its key"""
+    control = generation_controls[key] = GenerationControl()
+    try:
+        async for event in srs_generation_stream(request, resume, control, client):
+            yield event
+    finally:
+        generation_controls.pop(key, None)
+
+async def checkpoint_generation(srs_id: str, stage: str, partial_text: str):
+    """Persist progress so another process can resume if this one dies"""
+    try:
+        await asyncio.to_thread(srs_repo.checkpoint, srs_id, stage, partial_text)
+        logger.info("Checkpointed %s at %s", srs_id, stage, extra={"event": "checkpoint", "chars": len(partial_text)})
+    except Exception as db_error:
+        logger.warning("Checkpoint error: %s", db_error)
+
+async def keep_alive(srs_id: str):
+    """Refresh a running record between checkpoints (slow first tokens, rendering, translation) so it never looks stale"""
+    while True:
+        await asyncio.sleep(CHECKPOINT_INTERVAL)
+        try:
+            await asyncio.to_thread(srs_repo.touch, srs_id)
+        except Exception as db_error:
+            logger.warning("Heartbeat error: %s", db_error)
+
+async def recover_stale_generations():
+    """Resume or fail "Processing" records whose process stopped checkpointing them"""
+    cutoff = dt.datetime.utcnow() - dt.timedelta(seconds=STALE_GENERATION_SECONDS)
+    for srs_id in await asyncio.to_thread(srs_repo.find_stale, cutoff):
+        doc = await asyncio.to_thread(srs_repo.claim_stale, srs_id, cutoff)
+        if not doc:
+            continue  # Another worker claimed it
+        job = doc.get("job") or {}
+        if RECOVERY_POLICY != "resume" or not job.get("request") or job.get("attempts", 0) >= RECOVERY_MAX_ATTEMPTS:
+            await asyncio.to_thread(srs_repo.update, srs_id, {
+                "status": "Failed",
+                "pdf_url": "No PDF",
+                "word_url": "No Docx"
+            }, CHECKPOINT_FIELDS)
+            metrics.incr("recovery.failed")
+            logger.warning("Marked interrupted SRS %s as Failed", srs_id)
+            continue
+        
+        request = SRSGenerationRequest(**job["request"])
+        resume = {
+            "srsId": srs_id,
+            "template": job["template"],
+            "draftFrom": job.get("draftFrom"),
+            "client": job.get("client"),
+            "stage": doc.get("stage"),
+            "text": decompress_partial(doc)
+        }
+        # Under the request's fingerprint, so a client retrying the same request joins it
+        key = request_fingerprint(request.model_dump())
+        generations.start(key, lambda key=key, request=request, resume=resume: controlled_generation(key, request, resume))
+        metrics.incr("recovery.resumed")
+        logger.info("Resuming interrupted SRS %s from %d checkpointed characters", srs_id, len(resume['text']))
 
 @app.post("/generate-srs-stream")
-async def generate_srs_stream(request: SRSGenerationRequest):
+async def generate_srs_stream(request: SRSGenerationRequest, http_request: Request):
     """
     Generate SRS document with real-time progress updates via Server-Sent Events (SSE)
-    This endpoint combines SRS generation and document creation in one flow
+    This endpoint combines SRS generation and document creation in one flow.
+    Identical concurrent requests (double clicks, retries) share one generation.
     """
+    key = request_fingerprint(request.model_dump())
+    client = client_address(http_request)
+    events = generations.stream(key, lambda: controlled_generation(key, request, client=client))
+    headers = {
+        "Cache-Control": "no-cache",
+        "Connection": "keep-alive",
+        "X-Accel-Buffering": "no"  # Disable buffering for nginx
+    }
+    
+    # Compress per event with a sync flush so nothing waits in the compressor
+    encoding = sse_encoding(http_request)
+    if encoding:
+        events = compress_stream(events, encoding)
+        headers.update({"Content-Encoding": encoding, "Vary": "Accept-Encoding"})
+    
     return StreamingResponse(
-        srs_generation_stream(request),
+        events,
         media_type="text/event-stream",
-        headers={
-            "Cache-Control": "no-cache",
-            "Connection": "keep-alive",
-            "X-Accel-Buffering": "no"  # Disable buffering for nginx
-        }
+        headers=headers
     )
 
+@app.websocket("/ws/generate")
+async def generate_srs_ws(websocket: WebSocket):
+    """
+    Run several generations and section rewrites over one WebSocket.
+    Client messages, each with a client-chosen jobId:
+      {"type": "start", "request": {...}} starts a generation (same body as /generate-srs-stream)
+      {"type": "cancel"} stops a job at once
+      {"type": "summary"} has a running generation finish the remaining sections briefly
+      {"type": "regenerateSection", "srsId": ..., "sectionNumber": n, "request": {...}} rewrites a section
+    Server messages carry the jobId: "event" (the data of the SSE events), "ack", "error" and "done".
+    A job ends with "done" when it succeeds, or with an "error" carrying a status when it fails.
+    """
+    await websocket.accept()
+    metrics.incr("websocket.connections")
+    mux = JobMultiplexer(websocket)
+    client = client_address(websocket)
+    keys: dict[str, str] = {}  # jobId -> generation key, for control messages
+    
+    async def generation_job(job: str, events: AsyncGenerator[str, None]):
+        try:
+            await mux.forward(job, events)
+        finally:
+            keys.pop(job, None)  # The jobId may be reused once this job is done
+    
+    async def section_job(job: str, srs_id: str, section_number: int, request: SectionRegenerationRequest) -> bool:
+        try:
+            result = await rewrite_section(srs_id, section_number, request)
+        except HTTPException as e:
+            await mux.error(e.detail, job, status=e.status_code)
+        except (QueueFullError, QuotaExceededError) as e:
+            await mux.error(str(e), job, status=429)
+        except Exception as e:
+            logger.exception("Error regenerating section")
+            await mux.error(f"Error regenerating section: {str(e)}", job, status=500)
+        else:
+            await mux.send({"type": "event", "jobId": job, "event": {"status": "completed", **result}})
+            return True
+        return False  # The error is the job's last message
+    
+    try:
+        while True:
+            raw = await websocket.receive_text()
+            job = None
+            try:
+                message = json.loads(raw)
+                if not isinstance(message, dict):
+                    raise ValueError("Messages must be JSON objects")
+                kind = message.get("type")
+                job = message.get("jobId")
+                
+                if kind == "start":
+                    request = SRSGenerationRequest.model_validate(message.get("request") or {})
+                    key = request_fingerprint(request.model_dump())
+                    # Identical requests share one generation, as with the SSE endpoint
+                    events = generations.stream(key, lambda key=key, request=request: controlled_generation(key, request, client=client))
+                    mux.start(job, lambda job=job, events=events: generation_job(job, events))
+                    keys[job] = key
+                
+                elif kind == "cancel":
+                    if job not in mux.jobs:
+                        raise ValueError("No running job with this jobId")
+                    # Stops the generation itself unless other clients share it
+                    if job in keys:
+                        generations.cancel(keys.pop(job))
+                    mux.cancel(job)
+                    await mux.send({"type": "ack", "jobId": job, "action": "cancel"})
+                
+                elif kind == "summary":
+                    control = generation_controls.get(keys.get(job)) if job in mux.jobs else None
+                    if control is None:
+                        raise ValueError("No running generation with this jobId")
+                    # Like cancel, only the sole client of a generation may change it
+                    if generations.shared(keys[job]):
+                        raise ValueError("This generation is shared with other clients and cannot be switched to summary")
+                    control.summary = True
+                    await mux.send({"type": "ack", "jobId": job, "action": "summary"})
+                
+                elif kind == "regenerateSection":
+                    request = SectionRegenerationRequest.model_validate(message.get("request") or {})
+                    srs_id = str(message.get("srsId") or "")
+                    section_number = int(message.get("sectionNumber"))
+                    mux.start(job, lambda job=job, srs_id=srs_id, section_number=section_number, request=request:
+                              section_job(job, srs_id, section_number, request))
+                
+                else:
+                    raise ValueError(f"Unknown message type: {kind}")
+            
+            except (ValueError, TypeError) as e:
+                # Includes invalid JSON and request validation errors
+                await mux.error(str(e), job if isinstance(job, str) else None)
+    
+    except WebSocketDisconnect:
+        pass
+    finally:
+        await mux.close()
+
 if __name__ == "__main__":
     import uvicorn
     port = int(os.getenv("PORT", 8000))
+    # Development server; use gunicorn.conf.py for multiple workers in production
     uvicorn.run("app:app", host="0.0.0.0", port=port, reload=True)
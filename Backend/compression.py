@@ -0,0 +1,107 @@
+import os
+import json
+import zlib
+import hashlib
+from typing import AsyncIterator, Optional
+from fastapi import Request
+from fastapi.responses import Response
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Bodies smaller than this are not worth a compression round-trip
+MIN_COMPRESS_SIZE = int(os.getenv("MIN_COMPRESS_SIZE", 1024))
+SSE_COMPRESSION = os.getenv("SSE_COMPRESSION", "true").lower() == "true"
+
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """Pick "br" or "gzip" from an Accept-Encoding header, honouring q=0"""
+    if not accept_encoding:
+        return None
+    accepted = set()
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        q = params.strip()
+        if q.startswith("q="):
+            try:
+                if float(q[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        accepted.add(coding.strip().lower())
+    if brotli and "br" in accepted:
+        return "br"
+    if "gzip" in accepted or "*" in accepted:
+        return "gzip"
+    return None
+
+
+class StreamCompressor:
+    """Incremental compressor that flushes after every chunk so events are never held back"""
+
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == "br":
+            self._compressor = brotli.Compressor(quality=5)
+        else:
+            self._compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        if self.encoding == "br":
+            return self._compressor.process(data) + self._compressor.flush()
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        if self.encoding == "br":
+            return self._compressor.finish()
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+async def compress_stream(events: AsyncIterator[str], encoding: str) -> AsyncIterator[bytes]:
+    """Compress an SSE stream one event at a time, sharing one dictionary across events"""
+    compressor = StreamCompressor(encoding)
+    async for event in events:
+        yield compressor.compress(event.encode("utf-8"))
+    yield compressor.finish()
+
+
+def sse_encoding(request: Request) -> Optional[str]:
+    return negotiate_encoding(request.headers.get("accept-encoding")) if SSE_COMPRESSION else None
+
+
+def compress_body(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=5)
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    return compressor.compress(body) + compressor.flush()
+
+
+def compressed_json_response(
+    request: Request,
+    payload: dict,
+    status_code: int = 200,
+    cache_control: Optional[str] = None,
+) -> Response:
+    """
+    JSON response compressed for the client when large enough.
+    With cache_control set it also gets an ETag and answers If-None-Match with 304.
+    """
+    body = json.dumps(payload, separators=(",", ":"), default=str).encode("utf-8")
+    headers = {"Vary": "Accept-Encoding"}
+
+    if cache_control:
+        # Weak: the same JSON is served under different content encodings
+        etag = f'W/"{hashlib.sha256(body).hexdigest()[:32]}"'
+        headers.update({"ETag": etag, "Cache-Control": cache_control})
+        if_none_match = request.headers.get("if-none-match", "")
+        if etag.removeprefix("W/") in [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]:
+            return Response(status_code=304, headers=headers)
+
+    encoding = negotiate_encoding(request.headers.get("accept-encoding"))
+    if encoding and len(body) >= MIN_COMPRESS_SIZE:
+        body = compress_body(body, encoding)
+        headers["Content-Encoding"] = encoding
+
+    return Response(content=body, status_code=status_code, media_type="application/json", headers=headers)
@@ -0,0 +1,78 @@
+import os
+from typing import NamedTuple, Optional
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+from sections import parse_sections
+
+# Follow-up calls allowed after the first completion of a document
+MAX_CONTINUATIONS = int(os.getenv("MAX_CONTINUATIONS", 3))
+# Overlap searched for when a continuation restates the end of the previous text
+OVERLAP_WINDOW = 300
+MIN_OVERLAP = 20
+# Shorter overlaps count when they start at a word, e.g. a restated half-written heading
+MIN_WORD_OVERLAP = 8
+
+CONTINUE_INSTRUCTION = (
+    "Your previous reply was cut off. Continue the document exactly where it stopped. "
+    "Do not repeat any text that was already written and do not add any preamble."
+)
+
+MISSING_SECTIONS_INSTRUCTION = (
+    "The document is missing these sections:\n{missing}\n"
+    "Write only these sections now, with their numbered headings, in the same style. "
+    "Do not repeat the sections that were already written."
+)
+
+
+SUMMARY_INSTRUCTION = (
+    "Finish the document from exactly where it stopped, but keep the rest short: "
+    "cover each remaining section in a few sentences. "
+    "Do not repeat any text that was already written and do not add any preamble."
+)
+
+class Continuation(NamedTuple):
+    """Follow-up request for an incomplete completion"""
+    instruction: str
+    separator: str  # Placed between the existing text and the follow-up output
+
+
+def missing_sections(text: str, expected: tuple[str, ...]) -> list[str]:
+    """Expected section names with neither a numbered heading nor a heading mentioning them"""
+    _, sections = parse_sections(text, expected)
+    numbers = {section.number for section in sections}
+    headings = [section.heading.lower() for section in sections]
+    return [
+        f"{number}. {name}"
+        for number, name in enumerate(expected, start=1)
+        if number not in numbers and not any(name.lower() in heading for heading in headings)
+    ]
+
+
+def plan_continuation(finish_reason: Optional[str], text: str, expected: tuple[str, ...]) -> Optional[Continuation]:
+    """What to ask next for a completion, or None when it is complete"""
+    if finish_reason == "length":
+        # Cut off mid-sentence, so the follow-up is glued on directly
+        return Continuation(CONTINUE_INSTRUCTION, "")
+    missing = missing_sections(text, expected)
+    if missing:
+        return Continuation(MISSING_SECTIONS_INSTRUCTION.format(missing="\n".join(missing)), "\n\n")
+    return None
+
+
+def continuation_messages(messages: list[BaseMessage], text: str, continuation: Continuation) -> list[BaseMessage]:
+    """The original conversation with the text so far as the assistant's turn"""
+    return [*messages, AIMessage(content=text), HumanMessage(content=continuation.instruction)]
+
+
+def join_continuation(text: str, more: str, separator: str) -> str:
+    """Append a continuation, dropping any restated tail of the existing text"""
+    if not text:
+        return more
+    tail = text[-OVERLAP_WINDOW:]
+    stripped = more.lstrip()
+    for size in range(min(len(tail), len(stripped)), MIN_WORD_OVERLAP - 1, -1):
+        if not stripped.startswith(tail[-size:]):
+            continue
+        at_word = size == len(text) or text[-size - 1].isspace()
+        if size >= MIN_OVERLAP or at_word:
+            return text + stripped[size:]
+    return text.rstrip("\n") + separator + more.lstrip("\n") if separator else text + more
@@ -1,8 +1,11 @@
 import os
+import logging
 from pymongo import MongoClient
 from pymongo.database import Database
 from dotenv import load_dotenv
 
+logger = logging.getLogger(__name__)
+
 load_dotenv()
 
 class MongoDB:
@@ -22,8 +25,11 @@ def get_database() -> Database:
         if not mongo_uri:
             raise ValueError("MONGO_URI environment variable is not set")
         
-        # Create MongoDB client
-        MongoDB.client = MongoClient(mongo_uri)
+        # Create MongoDB client; fail fast so startup retries instead of hanging
+        MongoDB.client = MongoClient(
+            mongo_uri,
+            serverSelectionTimeoutMS=int(os.getenv("MONGO_TIMEOUT_MS", 5000))
+        )
         
         # Get database name from URI or use default
         db_name = os.getenv("MONGO_DB_NAME", "test")
@@ -31,11 +37,12 @@ def get_database() -> Database:
         
         # Test connection
         MongoDB.client.admin.command('ping')
-        print("[+] MongoDB Connected Successfully")
+        logger.info("MongoDB connected")
         
         return MongoDB.db
     except Exception as e:
-        print(f"[-] Database Connection Failed: {e}")
+        logger.error("Database connection failed: %s", e)
+        close_database()
         raise
 
 def close_database():
@@ -44,5 +51,5 @@ def close_database():
         MongoDB.client.close()
         MongoDB.client = None
         MongoDB.db = None
-        print("[+] MongoDB Connection Closed")
+        logger.info("MongoDB connection closed")
 
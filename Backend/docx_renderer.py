@@ -0,0 +1,77 @@
+import io
+import os
+import re
+import threading
+from pathlib import Path
+from typing import IO, Optional, Union
+
+# Optional branded .docx whose styles (and any cover content) every document starts from
+DOCX_TEMPLATE_PATH = os.getenv("DOCX_TEMPLATE_PATH", "")
+
+TITLE_STYLE = "Title"
+HEADING_STYLE = "Heading 1"
+# Body text uses the default paragraph style, so body paragraphs need no style at all
+BODY_STYLE = "Normal"
+
+_heading_re = re.compile(r'^\d+\.')
+
+_template: Optional[bytes] = None
+_template_lock = threading.Lock()
+
+
+def _build_template() -> bytes:
+    """Load the base document once and set up the styles the renderer uses"""
+    from docx import Document
+    from docx.enum.text import WD_ALIGN_PARAGRAPH
+    from docx.shared import Pt
+
+    doc = Document(DOCX_TEMPLATE_PATH or None)
+    if not DOCX_TEMPLATE_PATH:
+        # A branded template brings its own look; only the built-in one is adjusted
+        styles = doc.styles
+        styles[TITLE_STYLE].paragraph_format.alignment = WD_ALIGN_PARAGRAPH.CENTER
+        styles[HEADING_STYLE].font.size = Pt(14)
+        styles[BODY_STYLE].font.size = Pt(11)
+        styles[BODY_STYLE].paragraph_format.alignment = WD_ALIGN_PARAGRAPH.JUSTIFY
+
+    buffer = io.BytesIO()
+    doc.save(buffer)
+    return buffer.getvalue()
+
+
+def get_template() -> bytes:
+    global _template
+    with _template_lock:
+        if _template is None:
+            _template = _build_template()
+        return _template
+
+
+def render_docx(title: str, text: str, output: Union[str, Path, IO[bytes]]) -> None:
+    """Render an SRS into a copy of the in-memory template, written to a path or a binary stream"""
+    from docx import Document
+
+    doc = Document(io.BytesIO(get_template()))
+    # python-docx resolves a style name with an XPath scan of the styles part on
+    # every assignment, so the heading style id is looked up once and set directly
+    heading_id = doc.styles[HEADING_STYLE].style_id
+
+    doc.add_paragraph(title, TITLE_STYLE)
+    doc.add_paragraph()  # Empty line
+
+    for line in text.split('\n'):
+        line = line.strip()
+        if not line:
+            doc.add_paragraph()  # Empty line
+        elif _heading_re.match(line):
+            doc.add_paragraph(line)._p.style = heading_id
+        else:
+            doc.add_paragraph(line)
+
+    doc.save(str(output) if isinstance(output, Path) else output)
+
+
+def render_docx_bytes(title: str, text: str) -> bytes:
+    buffer = io.BytesIO()
+    render_docx(title, text, buffer)
+    return buffer.getvalue()
@@ -0,0 +1,242 @@
+import os
+import io
+import asyncio
+import hashlib
+import zipfile
+from collections import OrderedDict
+from email.utils import formatdate, parsedate_to_datetime
+from pathlib import Path
+from typing import Iterator, Optional
+from fastapi import Request
+from fastapi.responses import FileResponse, Response, StreamingResponse
+
+# Stored artifacts are write-once, so their names never point at new content
+DOWNLOAD_CACHE_CONTROL = os.getenv(
+    "DOWNLOAD_CACHE_CONTROL", "public, max-age=31536000, immutable"
+)
+CHUNK_SIZE = 64 * 1024
+ETAG_CACHE_SIZE = 1024
+
+# (path, mtime_ns, size) -> strong ETag, so each file is hashed once per process
+_etag_cache: "OrderedDict[tuple[str, int, int], str]" = OrderedDict()
+
+
+def _hash_file(filepath: Path) -> str:
+    """Compute a strong ETag from the file contents"""
+    digest = hashlib.sha256()
+    with open(filepath, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return f'"{digest.hexdigest()}"'
+
+
+async def get_etag(filepath: Path, stat_result: os.stat_result) -> str:
+    """Get the cached content-hash ETag for a file, hashing it off the event loop on a miss"""
+    key = (str(filepath), stat_result.st_mtime_ns, stat_result.st_size)
+    etag = _etag_cache.get(key)
+    if etag is not None:
+        _etag_cache.move_to_end(key)
+        return etag
+
+    etag = await asyncio.to_thread(_hash_file, filepath)
+    _etag_cache[key] = etag
+    if len(_etag_cache) > ETAG_CACHE_SIZE:
+        _etag_cache.popitem(last=False)
+    return etag
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    """Weak comparison of an If-None-Match / If-Range header against an ETag"""
+    candidates = [tag.strip() for tag in header.split(",")]
+    if "*" in candidates:
+        return True
+    return any(tag.removeprefix("W/") == etag for tag in candidates)
+
+
+def _not_modified_since(header: str, mtime: float) -> bool:
+    """Check an HTTP date header against the file modification time"""
+    try:
+        since = parsedate_to_datetime(header)
+    except (TypeError, ValueError):
+        return False
+    return int(mtime) <= since.timestamp()
+
+
+def parse_range(header: str, size: int) -> Optional[tuple[int, int]]:
+    """
+    Parse a single "bytes=" range into inclusive (start, end) offsets.
+    Returns None when the header should be ignored (malformed or multi-range)
+    and raises ValueError when the range cannot be satisfied.
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+
+    start_str, sep, end_str = spec.strip().partition("-")
+    start_str, end_str = start_str.strip(), end_str.strip()
+    if not sep:
+        return None
+
+    if not start_str:
+        # Suffix range: the last N bytes
+        if not end_str.isdigit():
+            return None
+        suffix = int(end_str)
+        if suffix == 0 or size == 0:
+            raise ValueError("Unsatisfiable suffix range")
+        return max(size - suffix, 0), size - 1
+
+    if not start_str.isdigit() or (end_str and not end_str.isdigit()):
+        return None
+    start = int(start_str)
+    end = int(end_str) if end_str else size - 1
+    if start > end:
+        return None
+    if start >= size:
+        raise ValueError("Range start beyond end of file")
+    return start, min(end, size - 1)
+
+
+def _iter_file_range(filepath: Path, start: int, end: int) -> Iterator[bytes]:
+    """Read [start, end] from a file in bounded chunks"""
+    remaining = end - start + 1
+    with open(filepath, "rb") as f:
+        f.seek(start)
+        while remaining > 0:
+            chunk = f.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+async def conditional_file_response(
+    request: Request,
+    filepath: Path,
+    filename: str,
+    media_type: str,
+) -> Response:
+    """
+    Serve a stored artifact with strong ETags, conditional GET (304) and
+    single-range (206) support. Raises FileNotFoundError if the file is missing.
+    """
+    stat_result = await asyncio.to_thread(os.stat, filepath)
+    etag = await get_etag(filepath, stat_result)
+    last_modified = formatdate(stat_result.st_mtime, usegmt=True)
+
+    headers = {
+        "ETag": etag,
+        "Last-Modified": last_modified,
+        "Cache-Control": DOWNLOAD_CACHE_CONTROL,
+        "Accept-Ranges": "bytes",
+    }
+
+    # If-None-Match takes precedence over If-Modified-Since (RFC 9110 13.2.2)
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        if _etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers=headers)
+    else:
+        if_modified_since = request.headers.get("if-modified-since")
+        if if_modified_since and _not_modified_since(if_modified_since, stat_result.st_mtime):
+            return Response(status_code=304, headers=headers)
+
+    range_header = request.headers.get("range")
+    if range_header:
+        # A stale If-Range means the client's partial copy is outdated: send it all
+        if_range = request.headers.get("if-range")
+        if if_range and not (
+            if_range.strip() == etag or _not_modified_since(if_range, stat_result.st_mtime)
+        ):
+            range_header = None
+
+    if range_header:
+        size = stat_result.st_size
+        try:
+            byte_range = parse_range(range_header, size)
+        except ValueError:
+            return Response(
+                status_code=416,
+                headers={**headers, "Content-Range": f"bytes */{size}"},
+            )
+
+        if byte_range is not None:
+            start, end = byte_range
+            headers.update({
+                "Content-Range": f"bytes {start}-{end}/{size}",
+                "Content-Length": str(end - start + 1),
+                "Content-Disposition": f'attachment; filename="{filename}"',
+            })
+            return StreamingResponse(
+                _iter_file_range(filepath, start, end),
+                status_code=206,
+                media_type=media_type,
+                headers=headers,
+            )
+
+    return FileResponse(
+        path=str(filepath),
+        filename=filename,
+        media_type=media_type,
+        headers=headers,
+        stat_result=stat_result,
+    )
+
+
+class _ZipStreamBuffer(io.RawIOBase):
+    """Write-only, non-seekable sink that lets zipfile stream entries out in chunks"""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks: list[bytes] = []
+        self._offset = 0
+        self.pending = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._chunks.append(data)
+        self._offset += len(data)
+        self.pending += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._offset
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        self.pending = 0
+        return data
+
+
+def iter_zip(entries: list[tuple[Path, str]]) -> Iterator[bytes]:
+    """
+    Stream a ZIP archive of (path, arcname) entries without temp files.
+    Files are copied in CHUNK_SIZE pieces and at most about one chunk of
+    archive output is buffered before it is yielded.
+    PDF and DOCX are already compressed, so entries are stored as-is.
+    """
+    buffer = _ZipStreamBuffer()
+    with zipfile.ZipFile(buffer, mode="w", compression=zipfile.ZIP_STORED) as archive:
+        for filepath, arcname in entries:
+            try:
+                zinfo = zipfile.ZipInfo.from_file(filepath, arcname)
+                src = open(filepath, "rb")
+            except FileNotFoundError:
+                # Deleted since the bundle was listed
+                continue
+
+            with src, archive.open(zinfo, mode="w") as dest:
+                for chunk in iter(lambda: src.read(CHUNK_SIZE), b""):
+                    dest.write(chunk)
+                    if buffer.pending >= CHUNK_SIZE:
+                        yield buffer.drain()
+            if buffer.pending:
+                yield buffer.drain()
+
+    # Central directory written on close
+    if buffer.pending:
+        yield buffer.drain()
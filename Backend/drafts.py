@@ -0,0 +1,50 @@
+import os
+import re
+import json
+from typing import Optional
+from shared_state import store
+from singleflight import request_fingerprint
+
+# How long a drafted title and outline wait for the final request
+DRAFT_TTL_SECONDS = int(os.getenv("DRAFT_TTL_SECONDS", 900))
+# Output budget for a draft; an outline is a few hundred tokens
+DRAFT_MAX_TOKENS = int(os.getenv("DRAFT_MAX_TOKENS", 600))
+
+# Form fields the title and outline depend on; the final request must match them
+DRAFT_FIELDS = ("main", "selectedPurpose", "selectedTarget", "selectedKeys")
+
+PLAN_INSTRUCTION = (
+    '\nUse the title "{title}" and organise the document along this outline, '
+    "writing full content under every heading:\n{outline}\n"
+)
+
+_title_re = re.compile(r'Title:\s*(.*)')
+
+
+def draft_key(user: str, fields: dict, template_name: str) -> str:
+    """Cache key of the draft for a user, the fields it depends on and the target template"""
+    relevant = {name: fields.get(name) for name in DRAFT_FIELDS}
+    return f"draft:{user}:{template_name}:{request_fingerprint(relevant)[:32]}"
+
+
+def parse_plan(text: str) -> dict:
+    """Split a drafted reply into its title and outline"""
+    match = _title_re.search(text)
+    title = re.sub(r'[\*\#\_]', '', match.group(1)).strip() if match else ""
+    outline = _title_re.sub('', text, count=1).strip()
+    # Keep only heading lines, in case the model started writing content anyway
+    outline = "\n".join(line.strip() for line in outline.splitlines() if re.match(r'\s*\d+(\.\d+)*\.?\s', line))
+    return {"title": title, "outline": outline}
+
+
+def get_draft(key: str) -> Optional[dict]:
+    value = store.get(key)
+    return json.loads(value) if value else None
+
+
+def save_draft(key: str, plan: dict) -> None:
+    store.set(key, json.dumps(plan), DRAFT_TTL_SECONDS)
+
+
+def plan_instruction(plan: dict) -> str:
+    return PLAN_INSTRUCTION.format(title=plan["title"], outline=plan["outline"])
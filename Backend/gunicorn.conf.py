@@ -0,0 +1,40 @@
+# Production server: gunicorn -c gunicorn.conf.py app:app
+import os
+import multiprocessing
+from uvicorn.workers import UvicornWorker
+
+bind = f"0.0.0.0:{os.getenv('PORT', 8080)}"
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+
+# SSE generations can run for minutes. On SIGTERM, uvicorn waits up to this long
+# for open streams, then the app drains generations whose clients left for up
+# to this long again, and finally flushes usage counters
+SSE_DRAIN_TIMEOUT = int(os.getenv("SSE_DRAIN_TIMEOUT", 120))
+# Time for the usage flush and closing connections after both waits
+SHUTDOWN_HEADROOM = int(os.getenv("SHUTDOWN_HEADROOM", 30))
+
+
+class DrainingUvicornWorker(UvicornWorker):
+    # Unbounded by default, which let gunicorn kill the worker before the app's own shutdown ran
+    CONFIG_KWARGS = {**UvicornWorker.CONFIG_KWARGS, "timeout_graceful_shutdown": SSE_DRAIN_TIMEOUT}
+
+
+worker_class = DrainingUvicornWorker
+
+# Import the app once in the master so workers share its memory copy-on-write
+preload_app = True
+
+graceful_timeout = 2 * SSE_DRAIN_TIMEOUT + SHUTDOWN_HEADROOM
+timeout = int(os.getenv("WORKER_TIMEOUT", 300))
+keepalive = 5
+
+
+def post_fork(server, worker):
+    """Drop connections and threads inherited from the master; each worker opens its own"""
+    from db_connect import close_database
+    from shared_state import store
+    from logs import after_fork
+    after_fork()
+    close_database()
+    store.reset()
+    server.log.info(f"[+] Worker {worker.pid} initialized")
@@ -0,0 +1,142 @@
+import os
+import re
+from typing import Optional
+from metrics import metrics
+
+# Model per tier; all default to gpt-4o-mini so routing only changes output budgets
+# until a deployment opts into a larger model for heavy requests
+MODEL_TIERS = {
+    "light": os.getenv("LLM_MODEL_LIGHT", "gpt-4o-mini"),
+    "standard": os.getenv("LLM_MODEL_STANDARD", "gpt-4o-mini"),
+    "heavy": os.getenv("LLM_MODEL_HEAVY", "gpt-4o-mini"),
+}
+
+MAX_OUTPUT_TOKENS = int(os.getenv("LLM_MAX_OUTPUT_TOKENS", 16384))
+MIN_OUTPUT_TOKENS = int(os.getenv("LLM_MIN_OUTPUT_TOKENS", 2048))
+SECTION_MIN_TOKENS = 1024
+DEFAULT_TEMPERATURE = float(os.getenv("LLM_TEMPERATURE", 0.8))
+
+DETAIL_MULTIPLIERS = {"brief": 0.5, "standard": 1.0, "detailed": 1.6}
+
+# Rough output tokens a filled-in item adds to the document
+BASE_TOKENS = 4000
+ITEM_TOKENS = {
+    "selectedKeys": 450,
+    "selectedIntegrations": 250,
+    "selectedPlatforms": 120,
+    "selectedPerformance": 150,
+    "selectedSecurity": 150,
+    "selectedTarget": 100,
+    "selectedLanguage": 60,
+}
+# Prompt templates that ask for a shorter document
+TEMPLATE_MULTIPLIERS = {"short": 0.5}
+
+# Headroom over the estimate so typical documents are not cut off
+HEADROOM = 1.3
+
+_item_split = re.compile(r"[,;\n]+")
+
+
+def count_items(value: Optional[str]) -> int:
+    """Count comma/semicolon/newline separated entries in a form field"""
+    if not value:
+        return 0
+    return sum(1 for item in _item_split.split(value) if item.strip())
+
+
+class RoutingDecision:
+    """Model and output budget chosen for one generation"""
+
+    def __init__(
+        self,
+        tier: str,
+        model: str,
+        max_tokens: int,
+        temperature: float,
+        estimated_tokens: int,
+        detail_level: str,
+    ):
+        self.tier = tier
+        self.model = model
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        self.estimated_tokens = estimated_tokens
+        self.detail_level = detail_level
+
+    def to_dict(self) -> dict:
+        return {
+            "tier": self.tier,
+            "model": self.model,
+            "maxTokens": self.max_tokens,
+            "temperature": self.temperature,
+            "estimatedTokens": self.estimated_tokens,
+            "detailLevel": self.detail_level,
+        }
+
+
+def estimate_output_tokens(fields: dict, detail_level: str, template_name: str = "") -> int:
+    """Estimate how many output tokens an SRS for these form fields needs"""
+    estimate = BASE_TOKENS + len((fields.get("main") or "").split()) * 4
+    for field, tokens in ITEM_TOKENS.items():
+        estimate += count_items(fields.get(field)) * tokens
+    estimate *= DETAIL_MULTIPLIERS.get(detail_level, 1.0)
+    estimate *= TEMPLATE_MULTIPLIERS.get(template_name, 1.0)
+    return int(estimate)
+
+
+def _budget(estimated: int, minimum: int) -> int:
+    """Round the estimate plus headroom up to a multiple of 512 within the configured bounds"""
+    budget = int(estimated * HEADROOM)
+    budget = -(-budget // 512) * 512
+    return max(minimum, min(MAX_OUTPUT_TOKENS, budget))
+
+
+def route_request(fields: dict, detail_level: Optional[str] = None, template_name: str = "") -> RoutingDecision:
+    """Pick max_tokens and model tier for a request and record the decision"""
+    detail_level = detail_level or "standard"
+    estimated = estimate_output_tokens(fields, detail_level, template_name)
+
+    max_tokens = _budget(estimated, MIN_OUTPUT_TOKENS)
+
+    if estimated < 5000 and detail_level != "detailed":
+        tier = "light"
+    elif estimated < 9000:
+        tier = "standard"
+    else:
+        tier = "heavy"
+
+    decision = RoutingDecision(
+        tier=tier,
+        model=MODEL_TIERS[tier],
+        max_tokens=max_tokens,
+        temperature=DEFAULT_TEMPERATURE,
+        estimated_tokens=estimated,
+        detail_level=detail_level,
+    )
+
+    metrics.incr(f"llm.route.tier.{tier}")
+    metrics.incr(f"llm.route.detail.{detail_level}")
+    metrics.observe("llm.route.max_tokens", max_tokens)
+    metrics.observe("llm.route.estimated_tokens", estimated)
+    metrics.event("llm.route", {**decision.to_dict(), "template": template_name})
+    return decision
+
+
+def route_section(section_text: str, detail_level: Optional[str] = None) -> RoutingDecision:
+    """Budget for rewriting a single section: about its current size, with room to grow"""
+    detail_level = detail_level or "standard"
+    estimated = int((len(section_text.split()) * 1.4 + 200) * DETAIL_MULTIPLIERS.get(detail_level, 1.0))
+    decision = RoutingDecision(
+        tier="light",
+        model=MODEL_TIERS["light"],
+        max_tokens=_budget(estimated, SECTION_MIN_TOKENS),
+        temperature=DEFAULT_TEMPERATURE,
+        estimated_tokens=estimated,
+        detail_level=detail_level,
+    )
+
+    metrics.incr("llm.route.section")
+    metrics.observe("llm.route.max_tokens", decision.max_tokens)
+    metrics.event("llm.route", {**decision.to_dict(), "template": "section"})
+    return decision
@@ -0,0 +1,245 @@
+import os
+import logging
+import queue
+import asyncio
+import threading
+from typing import Any, AsyncIterator, Callable, Iterator, Optional
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Quantized GGUF model for llama.cpp, e.g. a Q4_K_M build of TinyLlama or Llama 3
+LOCAL_LLM_MODEL_PATH = os.getenv("LOCAL_LLM_MODEL_PATH", "")
+LOCAL_LLM_CONTEXT = int(os.getenv("LOCAL_LLM_CONTEXT", 8192))
+LOCAL_LLM_THREADS = int(os.getenv("LOCAL_LLM_THREADS", os.cpu_count() or 4))
+# Each slot holds its own model context; one slot means one model per worker
+LOCAL_LLM_SLOTS = int(os.getenv("LOCAL_LLM_SLOTS", 1))
+LOCAL_LLM_MAX_QUEUE = int(os.getenv("LOCAL_LLM_MAX_QUEUE", 64))
+
+_ROLES = {"system": "system", "human": "user", "ai": "assistant"}
+
+
+def _load_model():
+    """Load the llama.cpp model; llama-cpp-python is only needed when the local provider is used"""
+    try:
+        from llama_cpp import Llama
+    except ImportError as e:
+        raise RuntimeError("llama-cpp-python is required for the local LLM provider") from e
+
+    if not LOCAL_LLM_MODEL_PATH:
+        raise RuntimeError("LOCAL_LLM_MODEL_PATH environment variable is not set")
+
+    logger.info("Loading local model %s", LOCAL_LLM_MODEL_PATH)
+    return Llama(
+        model_path=LOCAL_LLM_MODEL_PATH,
+        n_ctx=LOCAL_LLM_CONTEXT,
+        n_threads=LOCAL_LLM_THREADS,
+        verbose=False,
+    )
+
+
+class InferenceJob:
+    """One queued completion; results are pushed to emit(kind, payload) from the slot thread"""
+
+    def __init__(
+        self,
+        messages: list[dict],
+        max_tokens: int,
+        temperature: float,
+        stop: Optional[list[str]],
+        emit: Callable[[str, Any], None],
+    ):
+        self.messages = messages
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        self.stop = stop
+        self.emit = emit
+        self.cancelled = threading.Event()
+
+
+class LocalInferenceScheduler:
+    """
+    Shared FIFO queue in front of the local model slots.
+    llama.cpp contexts decode one sequence at a time, so concurrent users are
+    queued onto the loaded slot(s) instead of each loading a model.
+    """
+
+    def __init__(self, slots: int = 1, max_queue: int = 64):
+        self._slots = slots
+        self._queue: "queue.Queue[InferenceJob]" = queue.Queue(maxsize=max_queue)
+        self._threads: list[threading.Thread] = []
+        self._lock = threading.Lock()
+
+    def _ensure_started(self) -> None:
+        # Threads start lazily so they are created in the serving process, after any fork
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self._slots):
+                thread = threading.Thread(target=self._run_slot, name=f"local-llm-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def submit(self, job: InferenceJob) -> None:
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            raise RuntimeError("Local inference queue is full")
+        metrics.incr("local_llm.jobs")
+        metrics.observe("local_llm.queue_depth", self._queue.qsize())
+
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def _run_slot(self) -> None:
+        model = None
+        while True:
+            job = self._queue.get()
+            if job.cancelled.is_set():
+                continue
+            try:
+                if model is None:
+                    model = _load_model()
+
+                finish_reason = None
+                completion_tokens = 0
+                stream = model.create_chat_completion(
+                    messages=job.messages,
+                    max_tokens=job.max_tokens,
+                    temperature=job.temperature,
+                    stop=job.stop,
+                    stream=True,
+                )
+                for chunk in stream:
+                    if job.cancelled.is_set():
+                        finish_reason = "cancelled"
+                        break
+                    choice = chunk["choices"][0]
+                    text = choice["delta"].get("content")
+                    if text:
+                        completion_tokens += 1
+                        job.emit("token", text)
+                    if choice.get("finish_reason"):
+                        finish_reason = choice["finish_reason"]
+
+                metrics.incr("local_llm.completion_tokens", completion_tokens)
+                job.emit("done", {"finish_reason": finish_reason, "completion_tokens": completion_tokens})
+            except Exception as e:
+                logger.warning("Local inference failed: %s", e)
+                job.emit("error", e)
+
+
+scheduler = LocalInferenceScheduler(LOCAL_LLM_SLOTS, LOCAL_LLM_MAX_QUEUE)
+
+
+class LocalChatModel(BaseChatModel):
+    """LangChain chat model backed by the on-CPU llama.cpp scheduler"""
+
+    max_tokens: int = 4096
+    temperature: float = 0.8
+    model_name: str = os.path.basename(LOCAL_LLM_MODEL_PATH) or "local"
+
+    @property
+    def _llm_type(self) -> str:
+        return "local-llama-cpp"
+
+    def _submit(self, messages: list[BaseMessage], stop: Optional[list[str]], emit) -> InferenceJob:
+        job = InferenceJob(
+            messages=[{"role": _ROLES.get(m.type, "user"), "content": m.content} for m in messages],
+            max_tokens=min(self.max_tokens, LOCAL_LLM_CONTEXT),
+            temperature=self.temperature,
+            stop=stop,
+            emit=emit,
+        )
+        scheduler.submit(job)
+        return job
+
+    def _final_chunk(self, payload: dict) -> ChatGenerationChunk:
+        metadata = {"finish_reason": payload["finish_reason"], "model_name": self.model_name}
+        return ChatGenerationChunk(
+            message=AIMessageChunk(content="", response_metadata=metadata),
+            generation_info=metadata,
+        )
+
+    def _stream(
+        self,
+        messages: list[BaseMessage],
+        stop: Optional[list[str]] = None,
+        run_manager=None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        events: "queue.Queue[tuple[str, Any]]" = queue.Queue()
+        job = self._submit(messages, stop, lambda kind, payload: events.put((kind, payload)))
+        try:
+            while True:
+                kind, payload = events.get()
+                if kind == "token":
+                    if run_manager:
+                        run_manager.on_llm_new_token(payload)
+                    yield ChatGenerationChunk(message=AIMessageChunk(content=payload))
+                elif kind == "done":
+                    yield self._final_chunk(payload)
+                    return
+                else:
+                    raise payload
+        finally:
+            # Closing the stream early stops decoding at the next token
+            job.cancelled.set()
+
+    async def _astream(
+        self,
+        messages: list[BaseMessage],
+        stop: Optional[list[str]] = None,
+        run_manager=None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        loop = asyncio.get_running_loop()
+        events: "asyncio.Queue[tuple[str, Any]]" = asyncio.Queue()
+        job = self._submit(
+            messages, stop,
+            lambda kind, payload: loop.call_soon_threadsafe(events.put_nowait, (kind, payload)),
+        )
+        try:
+            while True:
+                kind, payload = await events.get()
+                if kind == "token":
+                    if run_manager:
+                        await run_manager.on_llm_new_token(payload)
+                    yield ChatGenerationChunk(message=AIMessageChunk(content=payload))
+                elif kind == "done":
+                    yield self._final_chunk(payload)
+                    return
+                else:
+                    raise payload
+        finally:
+            job.cancelled.set()
+
+    @staticmethod
+    def _to_result(chunks: list[ChatGenerationChunk]) -> ChatResult:
+        text = "".join(chunk.message.content for chunk in chunks)
+        metadata = (chunks[-1].generation_info or {}) if chunks else {}
+        message = AIMessage(content=text, response_metadata=metadata)
+        return ChatResult(generations=[ChatGeneration(message=message, generation_info=metadata)])
+
+    def _generate(
+        self,
+        messages: list[BaseMessage],
+        stop: Optional[list[str]] = None,
+        run_manager=None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        return self._to_result(list(self._stream(messages, stop, run_manager, **kwargs)))
+
+    async def _agenerate(
+        self,
+        messages: list[BaseMessage],
+        stop: Optional[list[str]] = None,
+        run_manager=None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        chunks = [chunk async for chunk in self._astream(messages, stop, run_manager, **kwargs)]
+        return self._to_result(chunks)
@@ -0,0 +1,126 @@
+import os
+import re
+import asyncio
+import hashlib
+from typing import Optional
+from langchain_core.messages import HumanMessage, SystemMessage
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.runnables import Runnable
+from continuation import MAX_CONTINUATIONS, continuation_messages, join_continuation, plan_continuation
+from metrics import metrics
+from prompts import registry as prompt_registry
+from sections import parse_sections
+from shared_state import store
+from usage import estimate_tokens, response_usage, usage_tracker
+
+# Language the document is generated in; the others are translated from it
+CANONICAL_LANGUAGE = os.getenv("CANONICAL_LANGUAGE", "English")
+MAX_LANGUAGES = int(os.getenv("MAX_LANGUAGES", 5))
+# Translation calls in flight at once across all documents in this worker
+TRANSLATION_CONCURRENCY = int(os.getenv("TRANSLATION_CONCURRENCY", 4))
+TRANSLATION_CACHE_TTL = int(os.getenv("TRANSLATION_CACHE_TTL", 7 * 24 * 3600))
+TRANSLATION_TEMPERATURE = float(os.getenv("TRANSLATION_TEMPERATURE", 0.2))
+
+# Languages recognised in the free-text selectedLanguage answer
+KNOWN_LANGUAGES = (
+    "Arabic", "Bengali", "Chinese", "Czech", "Danish", "Dutch", "English", "Finnish", "French",
+    "German", "Greek", "Hebrew", "Hindi", "Hungarian", "Indonesian", "Italian", "Japanese",
+    "Korean", "Malay", "Norwegian", "Persian", "Polish", "Portuguese", "Romanian", "Russian",
+    "Spanish", "Swahili", "Swedish", "Tamil", "Thai", "Turkish", "Ukrainian", "Urdu", "Vietnamese",
+)
+
+_known_language = re.compile(r"\b(" + "|".join(KNOWN_LANGUAGES) + r")\b", re.IGNORECASE)
+
+_slots: Optional[asyncio.Semaphore] = None
+
+
+def requested_languages(selected_language: Optional[str], languages: Optional[list[str]] = None) -> list[str]:
+    """
+    Languages to translate into, other than the canonical one, in order: the explicit
+    languages list if given, otherwise the known language names mentioned in selectedLanguage
+    """
+    if languages is None:
+        languages = [match.group(1) for match in _known_language.finditer(selected_language or "")]
+    requested: list[str] = []
+    for name in languages:
+        name = name.strip().title()
+        if name and name.lower() != CANONICAL_LANGUAGE.lower() and name not in requested:
+            requested.append(name)
+    return requested[:MAX_LANGUAGES]
+
+
+def translation_budget(text: str, expected: tuple[str, ...] = ()) -> int:
+    """Output tokens for translating the largest section of a document, with room for longer languages"""
+    _, sections = parse_sections(text, expected)
+    largest = max((estimate_tokens(section.text) for section in sections), default=estimate_tokens(text))
+    return int(largest * 2) + 256
+
+
+def _cache_key(language: str, text: str) -> str:
+    digest = hashlib.sha256(text.encode("utf-8")).hexdigest()[:32]
+    return f"translation:{language.lower()}:{digest}"
+
+
+async def translate_chunk(llm: Runnable, title: str, text: str, language: str, user: str) -> tuple[str, bool]:
+    """
+    Translate one piece of a document, reusing an earlier translation of the same text.
+    Returns the translation and whether it is still cut off after MAX_CONTINUATIONS follow-ups.
+    """
+    global _slots
+    key = _cache_key(language, text)
+    cached = await asyncio.to_thread(store.get, key)
+    if cached is not None:
+        metrics.incr("translation.cached")
+        return cached, False
+
+    template = prompt_registry.get("translate")
+    messages = [
+        SystemMessage(content=template.system),
+        HumanMessage(content=template.render({"title": title, "language": language, "sectionText": text}))
+    ]
+    if _slots is None:
+        _slots = asyncio.Semaphore(TRANSLATION_CONCURRENCY)
+    async with _slots:
+        response = await llm.ainvoke(messages)
+        translated = StrOutputParser().invoke(response)
+        usage_tracker.record(user, *response_usage(response, messages, translated))
+        # A long section can hit the output limit; continue it like a truncated document
+        for _ in range(MAX_CONTINUATIONS):
+            continuation = plan_continuation(response.response_metadata.get("finish_reason"), translated, ())
+            if not continuation:
+                break
+            metrics.incr("translation.continued")
+            round_messages = continuation_messages(messages, translated, continuation)
+            response = await llm.ainvoke(round_messages)
+            more = StrOutputParser().invoke(response)
+            usage_tracker.record(user, *response_usage(response, round_messages, more))
+            translated = join_continuation(translated, more, continuation.separator)
+    translated = translated.strip()
+    truncated = response.response_metadata.get("finish_reason") == "length"
+    if truncated:
+        # Not cached, so the next request tries again
+        metrics.incr("translation.truncated")
+        return translated, True
+    metrics.incr("translation.translated")
+    await asyncio.to_thread(store.set, key, translated, TRANSLATION_CACHE_TTL)
+    return translated, False
+
+
+async def translate_document(
+    llm: Runnable, title: str, text: str, language: str, user: str, expected: tuple[str, ...] = ()
+) -> tuple[str, str, bool]:
+    """
+    Translate the title and every section in parallel; returns the translated title and text,
+    and whether any part of it was cut off
+    """
+    preamble, sections = parse_sections(text, expected)
+    chunks = [preamble] if preamble.strip() else []
+    chunks.extend(section.text for section in sections)
+    if not sections:
+        chunks = [text]
+    translated = await asyncio.gather(
+        translate_chunk(llm, title, title, language, user),
+        *(translate_chunk(llm, title, chunk, language, user) for chunk in chunks)
+    )
+    truncated = any(cut_off for _, cut_off in translated)
+    return translated[0][0], "\n\n".join(part for part, _ in translated[1:]) + "\n", truncated
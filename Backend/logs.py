@@ -0,0 +1,161 @@
+import os
+import sys
+import json
+import time
+import uuid
+import queue
+import random
+import logging
+import datetime as dt
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+from metrics import metrics
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# "json" for one object per line, "text" for reading in a terminal
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+# Records waiting for the writer thread; beyond this they are dropped rather than blocking
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", 10000))
+# Share of high-volume events kept, as "event=rate,..."; warnings and errors are never sampled
+LOG_SAMPLE_RATES = {
+    name.strip(): float(rate)
+    for name, rate in (
+        item.split("=", 1) for item in os.getenv("LOG_SAMPLE_RATES", "request=0.1,checkpoint=0.1").split(",") if "=" in item
+    )
+}
+
+# Correlation ids attached to every record logged while handling a request or job
+request_id_var: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+job_id_var: ContextVar[Optional[str]] = ContextVar("job_id", default=None)
+
+# Attributes every LogRecord has; anything else was passed with extra= and is logged as a field
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "requestId", "jobId", "sampleRate"}
+
+_listener: Optional[QueueListener] = None
+_handler: Optional["NonBlockingQueueHandler"] = None
+
+
+class ContextFilter(logging.Filter):
+    """Stamp records with the current request and job ids"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.requestId = request_id_var.get()
+        record.jobId = job_id_var.get()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Keep a share of records tagged with a sampled event, e.g. extra={"event": "checkpoint"}"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        rate = LOG_SAMPLE_RATES.get(getattr(record, "event", None))
+        if rate is None or record.levelno >= logging.WARNING:
+            return True
+        record.sampleRate = rate
+        return random.random() < rate
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": dt.datetime.fromtimestamp(record.created, dt.timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for field in ("requestId", "jobId", "sampleRate"):
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        entry.update({key: value for key, value in vars(record).items() if key not in _RECORD_ATTRS})
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """Format in the caller, write from the listener thread, and drop records when the queue is full"""
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            metrics.incr("logs.dropped")
+
+
+def _start_listener() -> None:
+    global _listener
+    log_queue = queue.Queue(LOG_QUEUE_SIZE)
+    _handler.queue = log_queue
+    writer = logging.StreamHandler(sys.stdout)
+    # Records arrive already formatted by the queue handler
+    writer.setFormatter(logging.Formatter("%(message)s"))
+    _listener = QueueListener(log_queue, writer)
+    _listener.start()
+
+
+def setup_logging() -> None:
+    """Route the root logger through the queue; safe to call more than once"""
+    global _handler
+    if _handler is not None:
+        return
+    _handler = NonBlockingQueueHandler(queue.Queue())
+    _handler.addFilter(ContextFilter())
+    _handler.addFilter(SamplingFilter())
+    if LOG_FORMAT == "text":
+        _handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s [%(requestId)s] %(message)s"))
+    else:
+        _handler.setFormatter(JsonFormatter())
+    root = logging.getLogger()
+    root.setLevel(LOG_LEVEL)
+    root.addHandler(_handler)
+    _start_listener()
+
+
+def after_fork() -> None:
+    """The writer thread does not survive fork(); start a fresh one with its own queue"""
+    if _handler is not None:
+        _start_listener()
+
+
+def stop_logging() -> None:
+    """Flush queued records and stop the writer thread"""
+    if _listener is not None:
+        _listener.stop()
+
+
+class CorrelationMiddleware:
+    """Give each request an id (X-Request-ID, or a new one), echo it back and log the request when it ends"""
+
+    def __init__(self, app):
+        self.app = app
+        self.logger = logging.getLogger("access")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        headers = dict(scope["headers"])
+        rid = headers.get(b"x-request-id", b"").decode("latin-1")[:64] or uuid.uuid4().hex[:16]
+        token = request_id_var.set(rid)
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_id(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message["headers"] = [*message.get("headers", []), (b"x-request-id", rid.encode("latin-1"))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            # Streams are logged once they end, so the duration covers the whole response
+            self.logger.log(
+                logging.WARNING if status >= 500 else logging.INFO,
+                "%s %s %s", scope["method"], scope["path"], status,
+                extra={"event": "request", "status": status, "durationMs": round((time.perf_counter() - start) * 1000, 1)},
+            )
+            request_id_var.reset(token)
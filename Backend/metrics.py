@@ -0,0 +1,50 @@
+import threading
+import time
+from collections import deque
+from typing import Optional
+
+
+class Metrics:
+    """Thread-safe in-process counters, value summaries and a ring of recent events"""
+
+    def __init__(self, max_events: int = 200):
+        self._lock = threading.Lock()
+        self._counters: dict[str, int] = {}
+        self._summaries: dict[str, dict] = {}
+        self._events: deque = deque(maxlen=max_events)
+
+    def incr(self, name: str, value: int = 1) -> None:
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def observe(self, name: str, value: float) -> None:
+        """Record a value into a count/sum/min/max summary"""
+        with self._lock:
+            summary = self._summaries.get(name)
+            if summary is None:
+                self._summaries[name] = {"count": 1, "sum": value, "min": value, "max": value}
+            else:
+                summary["count"] += 1
+                summary["sum"] += value
+                summary["min"] = min(summary["min"], value)
+                summary["max"] = max(summary["max"], value)
+
+    def event(self, name: str, data: Optional[dict] = None) -> None:
+        """Keep a structured record of a recent decision for inspection"""
+        with self._lock:
+            self._events.append({"name": name, "time": time.time(), **(data or {})})
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            summaries = {
+                name: {**summary, "avg": summary["sum"] / summary["count"]}
+                for name, summary in self._summaries.items()
+            }
+            return {
+                "counters": dict(self._counters),
+                "summaries": summaries,
+                "events": list(self._events),
+            }
+
+
+metrics = Metrics()
@@ -1,6 +1,56 @@
+import zlib
 from datetime import datetime
 from typing import Optional
-from bson import ObjectId
+from bson import Binary, ObjectId
+from pymongo import ASCENDING, UpdateOne
+from prompts import template_sections
+from sections import parse_sections
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Large fields that list queries leave out; fetch them with find_text
+TEXT_FIELDS = ("text", "text_z", "partial_z")
+# The job of a running generation and its progress, dropped once it finishes
+CHECKPOINT_FIELDS = ("job", "stage", "partial_z")
+
+def compress_text(text: str, prompt_version: Optional[str] = None) -> dict:
+    """Mongo fields for the compressed canonical text and its section outline"""
+    data = text.encode("utf-8")
+    if zstandard:
+        codec, payload = "zstd", zstandard.ZstdCompressor(level=10).compress(data)
+    else:
+        codec, payload = "zlib", zlib.compress(data, 9)
+    _, sections = parse_sections(text, template_sections(prompt_version))
+    return {
+        "text_z": Binary(payload),
+        "text_codec": codec,
+        "text_size": len(data),
+        "sections": [
+            {"number": section.number, "heading": section.heading, "size": len(section.text)}
+            for section in sections
+        ],
+    }
+
+def decompress_partial(doc: dict) -> str:
+    """Text checkpointed by a generation that did not finish"""
+    payload = doc.get("partial_z")
+    return zlib.decompress(bytes(payload)).decode("utf-8") if payload is not None else ""
+
+def decompress_text(doc: dict) -> str:
+    """Read the canonical text, including plain "text" from records written before compression"""
+    payload = doc.get("text_z")
+    if payload is None:
+        return doc.get("text", "")
+    if doc.get("text_codec") == "zstd":
+        if zstandard is None:
+            raise RuntimeError("zstandard is required to read this SRS text")
+        data = zstandard.ZstdDecompressor().decompress(bytes(payload))
+    else:
+        data = zlib.decompress(bytes(payload))
+    return data.decode("utf-8")
 
 class SRSDocument:
     """SRS Document model matching the MongoDB schema"""
@@ -15,6 +65,9 @@ class SRSDocument:
         word_url: str = "",
         rating: Optional[int] = None,
         praises: Optional[list] = None,
+        text: str = "",
+        prompt_version: str = "",
+        revision: int = 0,
         created_at: Optional[datetime] = None,
         updated_at: Optional[datetime] = None,
         _id: Optional[ObjectId] = None
@@ -28,6 +81,9 @@ class SRSDocument:
         self.word_url = word_url
         self.rating = rating
         self.praises = praises or []
+        self.text = text  # Canonical generated SRS text
+        self.prompt_version = prompt_version  # Template the text was generated with, e.g. "ieee830@v1"
+        self.revision = revision  # Bumped by every section edit, see SRSRepository.update
         self.created_at = created_at or datetime.utcnow()
         self.updated_at = updated_at or datetime.utcnow()
     
@@ -55,6 +111,12 @@ class SRSDocument:
             "updatedAt": self.updated_at
         }
         
+        if self.prompt_version:
+            doc["prompt_version"] = self.prompt_version
+        
+        if self.text:
+            doc.update(compress_text(self.text, self.prompt_version))
+        
         if self._id:
             doc["_id"] = self._id
         
@@ -78,6 +140,9 @@ class SRSDocument:
             word_url=doc.get("word_url", ""),
             rating=doc.get("rating"),
             praises=doc.get("praises", []),
+            text=decompress_text(doc),
+            prompt_version=doc.get("prompt_version", ""),
+            revision=doc.get("revision", 0),
             created_at=doc.get("createdAt"),
             updated_at=doc.get("updatedAt")
         )
@@ -94,20 +159,68 @@ class SRSRepository:
         result = self.collection.insert_one(srs.to_dict())
         return str(result.inserted_id)
     
-    def update(self, srs_id: str, updates: dict) -> bool:
-        """Update SRS document"""
+    def update(self, srs_id: str, updates: dict, unset: tuple = (), revision: Optional[int] = None) -> bool:
+        """
+        Update SRS document; a "text" update is stored compressed with its outline.
+        With revision, the update only applies if nobody else has changed the record
+        since it was read at that revision, and bumps it.
+        """
         updates["updatedAt"] = datetime.utcnow()
-        result = self.collection.update_one(
+        query = {"_id": ObjectId(srs_id)}
+        operations = {"$set": updates}
+        if revision is not None:
+            # None also matches records that were never revised
+            query["revision"] = revision or None
+            operations["$inc"] = {"revision": 1}
+        removed = list(unset)
+        if "text" in updates:
+            updates.update(compress_text(updates.pop("text"), updates.get("prompt_version")))
+            removed.append("text")
+        if removed:
+            operations["$unset"] = {field: "" for field in removed}
+        result = self.collection.update_one(query, operations)
+        return result.modified_count > 0
+    
+    def checkpoint(self, srs_id: str, stage: str, partial_text: str) -> None:
+        """Save the progress of a running generation; also serves as its heartbeat via updatedAt"""
+        self.collection.update_one(
             {"_id": ObjectId(srs_id)},
-            {"$set": updates}
+            {"$set": {
+                "stage": stage,
+                # Written every few seconds, so favour speed over ratio
+                "partial_z": Binary(zlib.compress(partial_text.encode("utf-8"), 1)),
+                "updatedAt": datetime.utcnow()
+            }}
+        )
+    
+    def touch(self, srs_id: str) -> None:
+        """Heartbeat of a running generation between checkpoints"""
+        self.collection.update_one(
+            {"_id": ObjectId(srs_id), "status": "Processing"},
+            {"$set": {"updatedAt": datetime.utcnow()}}
+        )
+    
+    def find_stale(self, cutoff: datetime) -> list[str]:
+        """Ids of "Processing" records with no progress since cutoff"""
+        docs = self.collection.find({"status": "Processing", "updatedAt": {"$lt": cutoff}}, {"_id": 1})
+        return [str(doc["_id"]) for doc in docs]
+    
+    def claim_stale(self, srs_id: str, cutoff: datetime) -> Optional[dict]:
+        """Atomically take over a stale record so only one worker recovers it"""
+        return self.collection.find_one_and_update(
+            {"_id": ObjectId(srs_id), "status": "Processing", "updatedAt": {"$lt": cutoff}},
+            {"$set": {"updatedAt": datetime.utcnow()}, "$inc": {"job.attempts": 1}},
+            projection={"text": 0, "text_z": 0}
         )
-        return result.modified_count > 0
     
     def find_by_owner(self, owner: str) -> list[SRSDocument]:
         """Find all SRS documents by owner"""
         # Convert owner string to ObjectId for query
         owner_query = ObjectId(owner) if len(owner) == 24 else owner
-        docs = self.collection.find({"owner": owner_query}).sort("createdAt", -1)
+        docs = self.collection.find(
+            {"owner": owner_query},
+            {field: 0 for field in TEXT_FIELDS}
+        ).sort("createdAt", -1)
         return [SRSDocument.from_dict(doc) for doc in docs]
     
     def find_latest_by_owner(self, owner: str) -> Optional[SRSDocument]:
@@ -116,6 +229,7 @@ class SRSRepository:
         owner_query = ObjectId(owner) if len(owner) == 24 else owner
         doc = self.collection.find_one(
             {"owner": owner_query},
+            {field: 0 for field in TEXT_FIELDS},
             sort=[("createdAt", -1)]
         )
         return SRSDocument.from_dict(doc) if doc else None
@@ -124,4 +238,53 @@ class SRSRepository:
         """Find SRS document by ID"""
         doc = self.collection.find_one({"_id": ObjectId(srs_id)})
         return SRSDocument.from_dict(doc) if doc else None
+    
+    def find_text(self, srs_id: str) -> Optional[dict]:
+        """Fetch only the title, canonical text and section outline of an SRS"""
+        doc = self.collection.find_one(
+            {"_id": ObjectId(srs_id)},
+            {"name": 1, "text": 1, "text_z": 1, "text_codec": 1, "sections": 1, "prompt_version": 1, "updatedAt": 1}
+        )
+        if not doc:
+            return None
+        return {
+            "title": doc.get("name", ""),
+            "text": decompress_text(doc),
+            "sections": doc.get("sections", []),
+            "promptVersion": doc.get("prompt_version"),
+            "updatedAt": doc.get("updatedAt")
+        }
 
+
+class UsageRepository:
+    """Per-user, per-day token counters"""
+    
+    def __init__(self, db):
+        self.collection = db["usage"]
+        self.collection.create_index([("user", ASCENDING), ("day", ASCENDING)], unique=True)
+    
+    def add(self, batch: dict) -> None:
+        """Add a batch of {(user, day): counters} in one round trip"""
+        now = datetime.utcnow()
+        self.collection.bulk_write([
+            UpdateOne(
+                {"user": user, "day": day},
+                {"$inc": counters, "$set": {"updatedAt": now}, "$setOnInsert": {"month": day[:7]}},
+                upsert=True
+            )
+            for (user, day), counters in batch.items()
+        ], ordered=False)
+    
+    def totals(self, user: str, day: str) -> tuple[int, int]:
+        """Total tokens used on a day and in its month"""
+        day_total = month_total = 0
+        for doc in self.collection.find({"user": user, "month": day[:7]}, {"day": 1, "totalTokens": 1}):
+            month_total += doc.get("totalTokens", 0)
+            if doc["day"] == day:
+                day_total = doc.get("totalTokens", 0)
+        return day_total, month_total
+    
+    def history(self, user: str, since: str) -> list[dict]:
+        """Daily counters from a day onwards, oldest first"""
+        docs = self.collection.find({"user": user, "day": {"$gte": since}}, {"_id": 0, "user": 0, "month": 0, "updatedAt": 0})
+        return list(docs.sort("day", ASCENDING))
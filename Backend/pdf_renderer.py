@@ -0,0 +1,125 @@
+import re
+import threading
+from pathlib import Path
+from typing import IO, Union
+
+_heading_re = re.compile(r'^\d+\.')
+
+_styles = None
+_styles_lock = threading.Lock()
+
+
+def _escape(line: str) -> str:
+    # Escape special characters for ReportLab's paragraph markup
+    return line.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+
+
+def get_styles() -> dict:
+    """Paragraph styles, built once and shared by every document"""
+    global _styles
+    with _styles_lock:
+        if _styles is None:
+            from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+            from reportlab.lib.enums import TA_CENTER, TA_JUSTIFY
+
+            sample = getSampleStyleSheet()
+            _styles = {
+                "title": ParagraphStyle(
+                    'CustomTitle',
+                    parent=sample['Heading1'],
+                    fontSize=24,
+                    textColor='#1a1a1a',
+                    spaceAfter=30,
+                    alignment=TA_CENTER,
+                    fontName='Helvetica-Bold'
+                ),
+                "body": ParagraphStyle(
+                    'CustomBody',
+                    parent=sample['BodyText'],
+                    fontSize=11,
+                    textColor='#333333',
+                    alignment=TA_JUSTIFY,
+                    spaceAfter=12,
+                    fontName='Helvetica'
+                ),
+                "heading": ParagraphStyle(
+                    'CustomHeading',
+                    parent=sample['Heading2'],
+                    fontSize=14,
+                    textColor='#1a1a1a',
+                    spaceAfter=12,
+                    spaceBefore=12,
+                    fontName='Helvetica-Bold'
+                ),
+            }
+        return _styles
+
+
+def _standard_story(text: str, styles: dict) -> list:
+    """One flowable per line, as the original renderer laid documents out"""
+    from reportlab.platypus import Paragraph, Spacer
+    from reportlab.lib.units import inch
+
+    elements = []
+    for line in text.split('\n'):
+        line = line.strip()
+        if not line:
+            elements.append(Spacer(1, 0.1*inch))
+        elif _heading_re.match(line):
+            elements.append(Paragraph(_escape(line), styles["heading"]))
+        else:
+            elements.append(Paragraph(_escape(line), styles["body"]))
+    return elements
+
+
+def _compact_story(text: str, styles: dict) -> list:
+    """Consecutive body lines merged into one paragraph and blank runs collapsed"""
+    from reportlab.platypus import Paragraph, Spacer
+    from reportlab.lib.units import inch
+
+    # Flowables carry layout state, so spacers are not shared even though they look alike
+    elements = []
+    block: list[str] = []
+
+    def flush():
+        if block:
+            # Line breaks are kept, so lists and short lines still read as written
+            elements.append(Paragraph('<br/>'.join(block), styles["body"]))
+            block.clear()
+
+    for line in text.split('\n'):
+        line = line.strip()
+        if not line:
+            flush()
+            if elements and not isinstance(elements[-1], Spacer):
+                elements.append(Spacer(1, 0.1*inch))
+        elif _heading_re.match(line):
+            flush()
+            elements.append(Paragraph(_escape(line), styles["heading"]))
+        else:
+            block.append(_escape(line))
+    flush()
+    return elements
+
+
+def render_pdf(title: str, text: str, output: Union[str, Path, IO[bytes]], compact: bool = False) -> None:
+    """Render an SRS to a path or binary stream; compact mode trades per-line layout for smaller files"""
+    from reportlab.lib.pagesizes import letter
+    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
+    from reportlab.lib.units import inch
+
+    styles = get_styles()
+    options = {"pageCompression": 1} if compact else {}
+    doc = SimpleDocTemplate(
+        str(output) if isinstance(output, Path) else output,
+        pagesize=letter,
+        rightMargin=72,
+        leftMargin=72,
+        topMargin=72,
+        bottomMargin=18,
+        **options,
+    )
+
+    elements = [Paragraph(title, styles["title"]), Spacer(1, 0.2*inch)]
+    elements.extend(_compact_story(text, styles) if compact else _standard_story(text, styles))
+    doc.build(elements)
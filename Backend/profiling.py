@@ -0,0 +1,207 @@
+import os
+import logging
+import sys
+import time
+import uuid
+import threading
+import tracemalloc
+from collections import Counter
+from pathlib import Path
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Seconds between stack samples while CPU profiling is on
+PROFILE_SAMPLE_INTERVAL = float(os.getenv("PROFILE_SAMPLE_INTERVAL", 0.005))
+# Upper bound on any session, including ones waiting for the next N generations
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", 300))
+# Frames kept per allocation; deeper tracebacks cost more memory while tracing
+PROFILE_TRACEMALLOC_FRAMES = int(os.getenv("PROFILE_TRACEMALLOC_FRAMES", 10))
+PROFILE_TOP_ALLOCATIONS = int(os.getenv("PROFILE_TOP_ALLOCATIONS", 25))
+MAX_STACK_DEPTH = 64
+
+
+class ProfilerBusyError(Exception):
+    """Raised when a session is started while another is still running"""
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    # ";" separates frames in the collapsed format
+    return f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})".replace(";", ":")
+
+
+class ProfileSession:
+    """One profiling run and, once it stops, its results"""
+
+    def __init__(self, mode: str, seconds: Optional[float], generations: Optional[int]):
+        self.id = uuid.uuid4().hex[:8]
+        self.mode = mode
+        self.seconds = seconds
+        self.generations = generations
+        self.remaining = generations
+        self.started_at = time.time()
+        self.stopped_at: Optional[float] = None
+        self.stop_reason: Optional[str] = None
+        self.samples: Counter = Counter()
+        self.sample_count = 0
+        self.allocations: list[dict] = []
+        self.traced_memory: Optional[dict] = None
+
+    @property
+    def cpu(self) -> bool:
+        return self.mode in ("cpu", "both")
+
+    @property
+    def memory(self) -> bool:
+        return self.mode in ("memory", "both")
+
+    def collapsed(self) -> str:
+        """Stacks in the collapsed format read by flamegraph.pl, speedscope and inferno"""
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+    def to_dict(self) -> dict:
+        result = {
+            "id": self.id,
+            "mode": self.mode,
+            "worker": os.getpid(),
+            "seconds": self.seconds,
+            "generations": self.generations,
+            "remainingGenerations": self.remaining,
+            "startedAt": self.started_at,
+            "stoppedAt": self.stopped_at,
+            "stopReason": self.stop_reason,
+        }
+        if self.cpu:
+            result["samples"] = self.sample_count
+            result["sampleInterval"] = PROFILE_SAMPLE_INTERVAL
+        if self.memory:
+            result["tracedMemory"] = self.traced_memory
+            result["topAllocations"] = self.allocations
+        return result
+
+
+class Profiler:
+    """
+    On-demand profiling of this worker.
+    CPU mode samples every thread's stack from a background thread (wall clock,
+    so threads waiting on I/O show up too); memory mode runs tracemalloc and
+    reports the allocation sites that grew most. Nothing runs between sessions.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.session: Optional[ProfileSession] = None
+        self.last: Optional[ProfileSession] = None
+        self._stop_sampling = threading.Event()
+        self._sampler: Optional[threading.Thread] = None
+        self._timer: Optional[threading.Timer] = None
+        self._baseline: Optional[tracemalloc.Snapshot] = None
+        self._owns_tracemalloc = False
+
+    def start(self, mode: str, seconds: Optional[float] = None, generations: Optional[int] = None) -> ProfileSession:
+        """Start a session that stops after `seconds`, after `generations` finish, or at PROFILE_MAX_SECONDS"""
+        with self._lock:
+            if self.session is not None:
+                raise ProfilerBusyError(f"Profiling session {self.session.id} is already running")
+            session = ProfileSession(mode, seconds, generations)
+            if session.memory:
+                # Leave tracing alone afterwards if it was already on, e.g. via PYTHONTRACEMALLOC
+                self._owns_tracemalloc = not tracemalloc.is_tracing()
+                if self._owns_tracemalloc:
+                    tracemalloc.start(PROFILE_TRACEMALLOC_FRAMES)
+                self._baseline = tracemalloc.take_snapshot()
+            if session.cpu:
+                self._stop_sampling.clear()
+                self._sampler = threading.Thread(target=self._sample, args=(session,), name="profiler", daemon=True)
+                self._sampler.start()
+            self._timer = threading.Timer(min(seconds or PROFILE_MAX_SECONDS, PROFILE_MAX_SECONDS), self.stop, ("time",))
+            self._timer.daemon = True
+            self._timer.start()
+            self.session = session
+        logger.info("Profiling session %s started (%s)", session.id, mode)
+        return session
+
+    def _sample(self, session: ProfileSession) -> None:
+        own = threading.get_ident()
+        names = {}
+        while not self._stop_sampling.wait(PROFILE_SAMPLE_INTERVAL):
+            if len(names) != threading.active_count():
+                names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < MAX_STACK_DEPTH:
+                    stack.append(_frame_name(frame))
+                    frame = frame.f_back
+                stack.append(names.get(ident, "thread"))
+                session.samples[";".join(reversed(stack))] += 1
+            session.sample_count += 1
+
+    def generation_finished(self) -> None:
+        """Count a finished generation towards a session waiting for the next N"""
+        session = self.session
+        if session is None or session.remaining is None:
+            return
+        with self._lock:
+            if session is not self.session or session.remaining <= 0:
+                return
+            session.remaining -= 1
+            done = session.remaining <= 0
+        if done:
+            # Snapshots and joining the sampler take a moment, so keep them off the caller
+            threading.Thread(target=self.stop, args=("generations",), daemon=True).start()
+
+    def stop(self, reason: str = "requested") -> Optional[ProfileSession]:
+        """Stop the running session, if any, and return the latest finished one"""
+        with self._lock:
+            session = self.session
+            if session is None:
+                return self.last
+            self.session = None
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if session.cpu:
+                self._stop_sampling.set()
+                self._sampler.join()
+                self._sampler = None
+            if session.memory:
+                self._collect_allocations(session)
+            session.stopped_at = time.time()
+            session.stop_reason = reason
+            self.last = session
+        logger.info("Profiling session %s stopped (%s)", session.id, reason)
+        return session
+
+    def _collect_allocations(self, session: ProfileSession) -> None:
+        # The profiler's own bookkeeping is not what anyone is looking for
+        ignore = (tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__))
+        snapshot = tracemalloc.take_snapshot().filter_traces(ignore)
+        baseline = self._baseline.filter_traces(ignore)
+        current, peak = tracemalloc.get_traced_memory()
+        if self._owns_tracemalloc:
+            tracemalloc.stop()
+        session.traced_memory = {"current": current, "peak": peak}
+        session.allocations = [
+            {
+                "site": str(stat.traceback[0]),
+                "traceback": [str(frame) for frame in stat.traceback],
+                "size": stat.size,
+                "sizeDiff": stat.size_diff,
+                "count": stat.count,
+                "countDiff": stat.count_diff,
+            }
+            for stat in snapshot.compare_to(baseline, "traceback")[:PROFILE_TOP_ALLOCATIONS]
+        ]
+        self._baseline = None
+
+    def status(self) -> dict:
+        return {
+            "running": self.session.to_dict() if self.session else None,
+            "last": self.last.to_dict() if self.last else None,
+        }
+
+
+profiler = Profiler()
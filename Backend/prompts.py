@@ -0,0 +1,317 @@
+import os
+from string import Formatter
+from typing import Optional
+
+# Request fields a template may reference
+PROMPT_FIELDS = (
+    "main",
+    "selectedPurpose",
+    "selectedTarget",
+    "selectedKeys",
+    "selectedPlatforms",
+    "selectedIntegrations",
+    "selectedPerformance",
+    "selectedSecurity",
+    "selectedStorage",
+    "selectedEnvironment",
+    "selectedLanguage",
+    "draft",
+    "title",
+    "outline",
+    "sectionText",
+    "instructions",
+    "language",
+)
+
+DEFAULT_TEMPLATE = os.getenv("DEFAULT_PROMPT_TEMPLATE", "ieee830")
+# Records stored before prompts were versioned were generated with this template
+LEGACY_PROMPT_VERSION = "ieee830@v1"
+
+
+class PromptTemplate:
+    """Versioned prompt template, parsed once and rendered by plain string joins"""
+
+    def __init__(
+        self,
+        name: str,
+        version: int,
+        system: str,
+        body: str,
+        sections: tuple[str, ...],
+        description: str = "",
+        internal: bool = False,
+    ):
+        self.name = name
+        self.version = version
+        self.system = system
+        self.body = body
+        self.sections = sections
+        self.description = description
+        self.internal = internal  # Used by the server itself; clients cannot select or list it
+        # Pre-split into (literal, field) pairs so rendering never re-parses the body
+        self._parts = [(literal, field) for literal, field, _, _ in Formatter().parse(body)]
+
+        unknown = {field for _, field in self._parts if field} - set(PROMPT_FIELDS)
+        if unknown:
+            raise ValueError(f"Template {self.key} uses unknown fields: {sorted(unknown)}")
+
+    @property
+    def key(self) -> str:
+        """Stable identifier for cache keys, metrics and stored records"""
+        return f"{self.name}@v{self.version}"
+
+    def render(self, fields: dict) -> str:
+        """Render the user prompt from request fields"""
+        out = []
+        for literal, field in self._parts:
+            out.append(literal)
+            if field:
+                out.append(str(fields.get(field) or ""))
+        return "".join(out)
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "version": self.version,
+            "key": self.key,
+            "description": self.description,
+            "sections": list(self.sections),
+        }
+
+
+class PromptRegistry:
+    """In-memory registry of prompt templates; names resolve to their latest version"""
+
+    def __init__(self):
+        self._versions: dict[str, dict[int, PromptTemplate]] = {}
+
+    def register(self, template: PromptTemplate) -> None:
+        self._versions.setdefault(template.name, {})[template.version] = template
+
+    def get(self, name: Optional[str] = None) -> PromptTemplate:
+        """
+        Get a template by "name" (latest version) or pinned "name@vN",
+        falling back to the default; raises KeyError if unknown
+        """
+        name = name or DEFAULT_TEMPLATE
+        base, _, version = name.partition("@v")
+        versions = self._versions.get(base)
+        if versions:
+            if not version:
+                return versions[max(versions)]
+            if version.isdigit() and int(version) in versions:
+                return versions[int(version)]
+        raise KeyError(f"Unknown prompt template: {name}")
+
+    def get_public(self, name: Optional[str] = None) -> PromptTemplate:
+        """Like get, for a template chosen by a client; internal templates raise KeyError"""
+        template = self.get(name)
+        if template.internal:
+            raise KeyError(f"Unknown prompt template: {name}")
+        return template
+
+    def list(self) -> list[PromptTemplate]:
+        """Latest version of every template clients can select"""
+        return [versions[max(versions)] for versions in self._versions.values() if not versions[max(versions)].internal]
+
+
+SRS_SYSTEM_MESSAGE = (
+    "You are an expert technical writer specializing in Software Requirements Specification (SRS) "
+    "documents. You generate comprehensive, well-structured SRS documents following IEEE 830 standards."
+)
+
+_DETAILS = """Main Idea: {main}
+Primary Purpose: {selectedPurpose}
+Target Users: {selectedTarget}
+Key Features: {selectedKeys}
+Compatible Platforms: {selectedPlatforms}
+Integration Requirements: {selectedIntegrations}
+Performance Requirements: {selectedPerformance}
+Security Requirements: {selectedSecurity}
+Data Storage Capacity: {selectedStorage}
+Operating Environment: {selectedEnvironment}
+Language and Localization: {selectedLanguage}
+"""
+
+_TITLE_INSTRUCTION = (
+    'Please provide a suitable title for the software based on the main idea and write it like '
+    '"Title: [title generated]" at the top of the text.'
+)
+
+IEEE830_SECTIONS = (
+    "Introduction",
+    "Overall Description",
+    "Specific Requirements",
+    "System Features",
+    "External Interface Requirements",
+    "Non-Functional Requirements",
+)
+
+AGILE_SECTIONS = (
+    "Introduction",
+    "Product Vision",
+    "User Personas",
+    "Epics and User Stories",
+    "Acceptance Criteria",
+    "Non-Functional Requirements",
+)
+
+
+def _numbered(sections: tuple[str, ...]) -> str:
+    return "\n".join(f"{i}. {name}" for i, name in enumerate(sections, start=1))
+
+
+registry = PromptRegistry()
+
+registry.register(PromptTemplate(
+    name="ieee830",
+    version=1,
+    description="Comprehensive IEEE 830 style SRS",
+    sections=IEEE830_SECTIONS,
+    system=SRS_SYSTEM_MESSAGE,
+    body=f"""Generate a comprehensive Software Requirements Specification (SRS) document with the following details:
+
+{_DETAILS}
+{_TITLE_INSTRUCTION}
+
+Format the document with proper sections including:
+{_numbered(IEEE830_SECTIONS)}
+
+Use newline characters for formatting. Do not use markdown hash symbols (#) for headings.
+Write in a professional, technical style appropriate for an SRS document.
+""",
+))
+
+registry.register(PromptTemplate(
+    name="short",
+    version=1,
+    description="Concise SRS with brief sections, for quick drafts",
+    sections=IEEE830_SECTIONS,
+    system=SRS_SYSTEM_MESSAGE,
+    body=f"""Generate a concise Software Requirements Specification (SRS) document with the following details:
+
+{_DETAILS}
+{_TITLE_INSTRUCTION}
+
+Use exactly these numbered sections, each kept to a few short paragraphs or bullet points:
+{_numbered(IEEE830_SECTIONS)}
+
+Use newline characters for formatting. Do not use markdown hash symbols (#) for headings.
+Be brief and precise; avoid repeating the input details verbatim.
+""",
+))
+
+registry.register(PromptTemplate(
+    name="agile",
+    version=1,
+    description="Agile requirements document built around epics and user stories",
+    sections=AGILE_SECTIONS,
+    system=(
+        "You are an experienced product owner and technical writer. You turn product ideas into "
+        "clear agile requirements documents with epics, user stories and acceptance criteria."
+    ),
+    body=f"""Generate an agile requirements document for the following product:
+
+{_DETAILS}
+{_TITLE_INSTRUCTION}
+
+Format the document with these numbered sections:
+{_numbered(AGILE_SECTIONS)}
+
+Write user stories as "As a <user>, I want <goal> so that <benefit>" and give each story testable acceptance criteria.
+Use newline characters for formatting. Do not use markdown hash symbols (#) for headings.
+""",
+))
+
+registry.register(PromptTemplate(
+    name="outline",
+    version=1,
+    description="Title and section outline only, drafted while the request form is filled in",
+    sections=(),
+    system=SRS_SYSTEM_MESSAGE,
+    body=f"""Plan a Software Requirements Specification (SRS) document for the following product. Some details may still be empty.
+
+{_DETAILS}
+{_TITLE_INSTRUCTION}
+
+Below the title, write only the outline: each of these numbered sections followed by two to four numbered subsection headings (such as 1.1, 1.2), one per line.
+{{outline}}
+
+Do not write any section content. Do not use markdown hash symbols (#) for headings.
+""",
+    internal=True,
+))
+
+registry.register(PromptTemplate(
+    name="edit",
+    version=1,
+    description="Revise a similar existing SRS instead of writing one from scratch",
+    sections=IEEE830_SECTIONS,
+    system=SRS_SYSTEM_MESSAGE,
+    body=f"""Below is an existing SRS document written for a similar product. Revise it into an SRS for the product described by the new details.
+Keep the wording of everything that still applies and change only what the new details require.
+
+New details:
+{_DETAILS}
+{_TITLE_INSTRUCTION}
+
+Keep the document organised in these numbered sections:
+{_numbered(IEEE830_SECTIONS)}
+
+Use newline characters for formatting. Do not use markdown hash symbols (#) for headings.
+
+Existing SRS:
+{{draft}}
+""",
+    internal=True,
+))
+
+registry.register(PromptTemplate(
+    name="section",
+    version=1,
+    description="Rewrite a single section of an existing SRS",
+    sections=(),
+    system=SRS_SYSTEM_MESSAGE,
+    body="""You are revising one section of the SRS document "{title}".
+
+The document is organised in these sections:
+{outline}
+
+Product details:
+""" + _DETAILS + """
+Rewrite the following section. Keep its numbered heading as the first line and do not write any other section.
+Change requests: {instructions}
+
+Current section:
+{sectionText}
+
+Use newline characters for formatting. Do not use markdown hash symbols (#) for headings.
+""",
+    internal=True,
+))
+
+registry.register(PromptTemplate(
+    name="translate",
+    version=1,
+    description="Translate one section of a finished SRS",
+    sections=(),
+    system=(
+        "You are a professional technical translator. You translate software requirements documents "
+        "accurately and consistently, keeping their structure intact."
+    ),
+    body="""Translate the following part of the SRS document "{title}" into {language}.
+Keep the numbering of headings, lists and requirement identifiers exactly as it is. Keep product names, code, units and acronyms unchanged.
+Reply with the translation only, without any notes or preamble.
+
+{sectionText}
+""",
+    internal=True,
+))
+
+
+def template_sections(prompt_version: Optional[str]) -> tuple[str, ...]:
+    """Section names of the template a stored SRS was generated with"""
+    try:
+        return registry.get(prompt_version or LEGACY_PROMPT_VERSION).sections
+    except KeyError:
+        return ()
@@ -0,0 +1,84 @@
+import re
+from typing import Optional
+
+# Top-level numbered headings such as "3. Specific Requirements" (not "3.1 ...")
+_SECTION_HEADING = re.compile(r"^[\s*#]*(\d+)\.(?!\d)\s*(.*?)[\s*]*$")
+MAX_HEADING_LENGTH = 80
+
+
+class Section:
+    """One top-level numbered section of an SRS"""
+
+    def __init__(self, number: int, heading: str, body: str):
+        self.number = number
+        self.heading = heading
+        self.body = body
+
+    @property
+    def text(self) -> str:
+        return f"{self.heading}\n{self.body}" if self.body else self.heading
+
+    def to_dict(self) -> dict:
+        return {"number": self.number, "heading": self.heading, "text": self.text}
+
+
+def _normalize(name: str) -> str:
+    return re.sub(r"[^a-z0-9]", "", name.lower())
+
+
+def _is_heading(match: re.Match, sections: list[Section], expected: tuple[str, ...]) -> bool:
+    number, heading = int(match.group(1)), match.group(2)
+    if len(heading) > MAX_HEADING_LENGTH:
+        return False
+    if not expected:
+        # Numbered list items inside a section are skipped by requiring the next number in sequence
+        return number == len(sections) + 1
+    # Against a known template, a heading must name the section its number stands for,
+    # so a list item such as "3. Login" inside section 2 is body text
+    if number > len(expected) or (sections and number <= sections[-1].number):
+        return False
+    return _normalize(expected[number - 1]) in _normalize(heading)
+
+
+def parse_sections(text: str, expected: tuple[str, ...] = ()) -> tuple[str, list[Section]]:
+    """
+    Split SRS text into the preamble before the first heading and its numbered sections.
+    expected is the template's section names; without it headings are found by numbering alone.
+    """
+    preamble: list[str] = []
+    sections: list[Section] = []
+    body: list[str] = []
+    for line in text.split("\n"):
+        match = _SECTION_HEADING.match(line)
+        if match and _is_heading(match, sections, expected):
+            if sections:
+                sections[-1].body = "\n".join(body).strip("\n")
+            number = int(match.group(1))
+            sections.append(Section(number, f"{number}. {match.group(2)}", ""))
+            body = []
+        elif sections:
+            body.append(line)
+        else:
+            preamble.append(line)
+    if sections:
+        sections[-1].body = "\n".join(body).strip("\n")
+    return "\n".join(preamble).strip("\n"), sections
+
+
+def assemble_sections(preamble: str, sections: list[Section]) -> str:
+    """Inverse of parse_sections"""
+    parts = [preamble] if preamble else []
+    parts.extend(section.text for section in sections)
+    return "\n\n".join(parts) + "\n"
+
+
+def find_section(sections: list[Section], number: int) -> Optional[Section]:
+    return next((section for section in sections if section.number == number), None)
+
+
+def strip_heading(text: str) -> str:
+    """Drop a leading numbered heading line, e.g. from a rewritten section"""
+    lines = text.strip("\n").split("\n")
+    if lines and _SECTION_HEADING.match(lines[0]):
+        lines = lines[1:]
+    return "\n".join(lines).strip("\n")
@@ -0,0 +1,97 @@
+import os
+import logging
+import time
+import threading
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+# Shared by all workers; without it every worker keeps its own in-memory state
+REDIS_URL = os.getenv("REDIS_URL", "")
+KEY_PREFIX = os.getenv("REDIS_KEY_PREFIX", "srs:")
+
+
+class MemoryStore:
+    """In-process stand-in for Redis with the same small API, for tests and single-worker runs"""
+
+    shared = False
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data: dict[str, tuple[str, Optional[float]]] = {}
+
+    def _live(self, key: str) -> Optional[str]:
+        item = self._data.get(key)
+        if item is None:
+            return None
+        value, expires = item
+        if expires is not None and expires <= time.monotonic():
+            del self._data[key]
+            return None
+        return value
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            return self._live(key)
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None) -> None:
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ttl if ttl else None)
+
+    def keys(self, prefix: str) -> list[str]:
+        with self._lock:
+            return [key for key in list(self._data) if key.startswith(prefix) and self._live(key) is not None]
+
+    def reset(self) -> None:
+        pass
+
+
+class RedisStore:
+    """Redis-backed store shared by every worker process"""
+
+    shared = True
+
+    def __init__(self, url: str):
+        self._url = url
+        self._client = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        # Connect lazily so each forked worker opens its own connection pool
+        with self._lock:
+            if self._client is None:
+                self._client = redis.Redis.from_url(self._url, decode_responses=True)
+            return self._client
+
+    def get(self, key: str) -> Optional[str]:
+        return self.client.get(KEY_PREFIX + key)
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None) -> None:
+        self.client.set(KEY_PREFIX + key, value, px=int(ttl * 1000) if ttl else None)
+
+    def keys(self, prefix: str) -> list[str]:
+        return [key[len(KEY_PREFIX):] for key in self.client.scan_iter(match=KEY_PREFIX + prefix + "*")]
+
+    def reset(self) -> None:
+        """Drop connections inherited from the parent process after a fork"""
+        with self._lock:
+            if self._client is not None:
+                self._client.connection_pool.reset()
+            self._client = None
+
+
+def _create_store():
+    if REDIS_URL and redis is not None:
+        return RedisStore(REDIS_URL)
+    if REDIS_URL:
+        logger.warning("REDIS_URL is set but the redis package is not installed, using in-memory state")
+    return MemoryStore()
+
+
+store = _create_store()
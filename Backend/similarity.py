@@ -0,0 +1,324 @@
+import os
+import logging
+import re
+import json
+import zlib
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional
+import numpy as np
+from metrics import metrics
+from prompts import LEGACY_PROMPT_VERSION
+
+logger = logging.getLogger(__name__)
+
+try:
+    import fcntl
+except ImportError:  # Windows: a single worker process is assumed
+    fcntl = None
+
+INDEX_DIR = Path(os.getenv("SRS_INDEX_DIR", Path(__file__).parent / "index"))
+# Optional sentence-transformers model; the hashed TF-IDF backend is used without it
+EMBEDDING_MODEL = os.getenv("SRS_EMBEDDING_MODEL", "")
+# "owner" only matches a user's own documents, "global" matches everyone's
+SIMILARITY_SCOPE = os.getenv("SIMILARITY_SCOPE", "owner")
+# Above this score an existing SRS is reused as-is instead of generating a new one
+REUSE_THRESHOLD = float(os.getenv("SIMILARITY_REUSE_THRESHOLD", 0.97))
+# Above this score an existing SRS is used as a draft for the cheaper edit prompt
+DRAFT_THRESHOLD = float(os.getenv("SIMILARITY_DRAFT_THRESHOLD", 0.6))
+
+HASH_DIM = 2048
+# Stored file names start with the username, then a _YYYYMMDD_HHMMSS timestamp
+_artifact_re = re.compile(r"^(.+?)_\d{8}_\d{6}")
+
+FIELD_NAMES = (
+    "main",
+    "selectedPurpose",
+    "selectedTarget",
+    "selectedKeys",
+    "selectedPlatforms",
+    "selectedIntegrations",
+    "selectedPerformance",
+    "selectedSecurity",
+    "selectedStorage",
+    "selectedEnvironment",
+    "selectedLanguage",
+)
+
+_token_re = re.compile(r"[a-z0-9]+")
+
+
+def fields_text(fields: dict) -> str:
+    return "\n".join(str(fields.get(name) or "") for name in FIELD_NAMES)
+
+
+def artifact_owner(filename: str) -> Optional[str]:
+    """Username a stored PDF or DOCX name was generated for"""
+    match = _artifact_re.match(filename or "")
+    return match.group(1) if match else None
+
+
+class HashedTfidfEncoder:
+    """Hashing-trick bag of unigrams and bigrams; IDF is applied at query time"""
+
+    name = "tfidf"
+    dim = HASH_DIM
+
+    def encode(self, text: str) -> np.ndarray:
+        tokens = _token_re.findall(text.lower())
+        terms = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+        vector = np.zeros(self.dim, dtype=np.float32)
+        if not terms:
+            return vector
+        # crc32 is stable across processes, unlike hash()
+        buckets = np.fromiter((zlib.crc32(t.encode()) % self.dim for t in terms), dtype=np.int64, count=len(terms))
+        np.add.at(vector, buckets, 1.0)
+        nonzero = vector > 0
+        vector[nonzero] = 1.0 + np.log(vector[nonzero])  # Sublinear term frequency
+        return vector
+
+
+class SentenceEncoder:
+    """Dense sentence embeddings from a small CPU sentence-transformers model"""
+
+    def __init__(self, model_name: str):
+        from sentence_transformers import SentenceTransformer
+        self._model = SentenceTransformer(model_name, device="cpu")
+        self.name = "st-" + re.sub(r"[^\w\-]", "_", model_name)
+        self.dim = self._model.get_sentence_embedding_dimension()
+
+    def encode(self, text: str) -> np.ndarray:
+        return self._model.encode(text, normalize_embeddings=True).astype(np.float32)
+
+
+def _get_encoder():
+    if EMBEDDING_MODEL:
+        try:
+            return SentenceEncoder(EMBEDDING_MODEL)
+        except Exception as e:
+            logger.warning("Falling back to TF-IDF similarity: %s", e)
+    return HashedTfidfEncoder()
+
+
+class SRSIndex:
+    """
+    Append-only nearest-neighbour index over past SRS requests.
+    Vectors live in a raw float32 file read through np.memmap, metadata in a
+    JSON-lines file and the SRS text zlib-compressed per record. Later changes
+    to a record's metadata, such as new file names after a section edit, are
+    appended to a second JSON-lines file and applied over the original.
+    """
+
+    def __init__(self, directory: Path, encoder=None):
+        self.base_directory = directory
+        self.encoder = encoder
+        self._lock = threading.Lock()
+        self._meta: list[dict] = []
+        self._ids: set[str] = set()
+        self._vectors: Optional[np.memmap] = None
+        self._df: Optional[np.ndarray] = None
+        self._meta_size = 0
+        self._changes: dict[str, dict] = {}
+        self._changes_size = 0
+        self._loaded = False
+
+    def _load(self) -> None:
+        """Pick the encoder and read the index on first use, not at import"""
+        if self._loaded:
+            return
+        self.encoder = self.encoder or _get_encoder()
+        # One sub-index per embedding backend so vectors never mix
+        self.directory = self.base_directory / self.encoder.name
+        self.vectors_path = self.directory / "vectors.f32"
+        self.meta_path = self.directory / "meta.jsonl"
+        self.changes_path = self.directory / "changes.jsonl"
+        self.df_path = self.directory / "df.npy"
+        self.texts_dir = self.directory / "texts"
+        self.lock_path = self.directory / ".lock"
+
+        self.texts_dir.mkdir(parents=True, exist_ok=True)
+        self._df = np.zeros(self.encoder.dim, dtype=np.float32)
+        self._refresh()
+        self._loaded = True
+
+    def _refresh(self) -> None:
+        """Pick up records appended by other worker processes since the last read"""
+        self._refresh_changes()
+        size = self.meta_path.stat().st_size if self.meta_path.exists() else 0
+        if size == self._meta_size:
+            return
+        with open(self.meta_path, "rb") as f:
+            f.seek(self._meta_size)
+            appended = f.read(size - self._meta_size)
+        for line in appended.decode("utf-8").splitlines():
+            if line.strip():
+                record = json.loads(line)
+                self._meta.append(record)
+                self._ids.add(record["srsId"])
+        self._meta_size = size
+        if self.df_path.exists():
+            self._df = np.load(self.df_path)
+        self._remap()
+
+    def _refresh_changes(self) -> None:
+        size = self.changes_path.stat().st_size if self.changes_path.exists() else 0
+        if size == self._changes_size:
+            return
+        with open(self.changes_path, "rb") as f:
+            f.seek(self._changes_size)
+            appended = f.read(size - self._changes_size)
+        for line in appended.decode("utf-8").splitlines():
+            if line.strip():
+                change = json.loads(line)
+                self._changes.setdefault(change.pop("srsId"), {}).update(change)
+        self._changes_size = size
+
+    @contextmanager
+    def _file_lock(self):
+        """Serialize appends across worker processes so vector rows line up with metadata lines"""
+        if fcntl is None:
+            yield
+            return
+        with open(self.lock_path, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _remap(self) -> None:
+        rows = len(self._meta)
+        if rows and self.vectors_path.exists():
+            self._vectors = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(rows, self.encoder.dim))
+        else:
+            self._vectors = None
+
+    def add(self, srs_id: str, fields: dict, text: str, meta: dict) -> None:
+        """Index a completed SRS; re-adding the same id is a no-op"""
+        with self._lock:
+            self._load()
+            # Queries are new requests, so records are embedded by their request fields;
+            # the text is kept alongside to be offered or used as a draft
+            vector = self.encoder.encode(fields_text(fields))
+            with self._file_lock():
+                self._refresh()
+                if srs_id in self._ids:
+                    return
+                with open(self.vectors_path, "ab") as f:
+                    f.write(vector.astype(np.float32).tobytes())
+                self._df += (vector > 0)
+                np.save(self.df_path, self._df)
+                if text:
+                    (self.texts_dir / f"{srs_id}.txt.z").write_bytes(zlib.compress(text.encode("utf-8")))
+                record = {"srsId": srs_id, **meta, "hasText": bool(text)}
+                line = (json.dumps(record) + "\n").encode("utf-8")
+                with open(self.meta_path, "ab") as f:
+                    f.write(line)
+                self._meta.append(record)
+                self._ids.add(srs_id)
+                self._meta_size += len(line)
+                self._remap()
+        metrics.incr("similarity.indexed")
+
+    def update(self, srs_id: str, text: str, changes: dict) -> bool:
+        """Replace the stored text of an indexed SRS and change its metadata; False if it is not indexed"""
+        with self._lock:
+            self._load()
+            with self._file_lock():
+                self._refresh()
+                if srs_id not in self._ids:
+                    return False
+                text_path = self.texts_dir / f"{srs_id}.txt.z"
+                tmp_path = text_path.with_suffix(".tmp")
+                tmp_path.write_bytes(zlib.compress(text.encode("utf-8")))
+                os.replace(tmp_path, text_path)
+                line = (json.dumps({"srsId": srs_id, **changes, "hasText": True}) + "\n").encode("utf-8")
+                with open(self.changes_path, "ab") as f:
+                    f.write(line)
+                self._changes.setdefault(srs_id, {}).update({**changes, "hasText": True})
+                self._changes_size += len(line)
+        metrics.incr("similarity.updated")
+        return True
+
+    def search(self, fields: dict, owner: Optional[str] = None, k: int = 3) -> list[dict]:
+        """Return the k nearest past SRS documents with their cosine similarity"""
+        with self._lock:
+            self._load()
+            self._refresh()
+            vectors, meta, df = self._vectors, list(self._meta), self._df.copy()
+            changes = dict(self._changes)
+        if vectors is None:
+            return []
+
+        if SIMILARITY_SCOPE == "owner":
+            # Anonymous requests have no documents of their own to match
+            if owner is None:
+                return []
+            rows = np.array([i for i, m in enumerate(meta) if m.get("owner") == owner], dtype=np.int64)
+            if rows.size == 0:
+                return []
+        else:
+            rows = np.arange(len(meta))
+
+        matrix = np.asarray(vectors[rows])
+        query = self.encoder.encode(fields_text(fields))
+        if isinstance(self.encoder, HashedTfidfEncoder):
+            idf = np.log((1.0 + len(meta)) / (1.0 + df)) + 1.0
+            matrix = matrix * idf
+            query = query * idf
+        norms = np.linalg.norm(matrix, axis=1) * (np.linalg.norm(query) or 1.0)
+        scores = (matrix @ query) / np.where(norms == 0, 1.0, norms)
+
+        top = np.argsort(-scores)[:k]
+        metrics.incr("similarity.searches")
+        return [
+            {**meta[rows[i]], **changes.get(meta[rows[i]]["srsId"], {}), "score": round(float(scores[i]), 4)}
+            for i in top
+        ]
+
+    def get_text(self, srs_id: str) -> Optional[str]:
+        with self._lock:
+            self._load()
+        path = self.texts_dir / f"{srs_id}.txt.z"
+        if not path.exists():
+            return None
+        return zlib.decompress(path.read_bytes()).decode("utf-8")
+
+    def backfill(self, collection) -> int:
+        """Index completed Mongo SRS records by their stored request fields"""
+        from models import decompress_text
+        with self._lock:
+            self._load()
+        added = 0
+        for doc in collection.find({"status": "Completed"}):
+            srs_id = str(doc["_id"])
+            try:
+                values = json.loads(doc.get("description") or "[]")
+            except ValueError:
+                continue
+            if srs_id in self._ids or not isinstance(values, list):
+                continue
+            fields = dict(zip(FIELD_NAMES, values))
+            job = doc.get("job") or {}
+            owner = doc.get("owner")
+            prompt_version = doc.get("prompt_version") or job.get("template") or LEGACY_PROMPT_VERSION
+            self.add(srs_id, fields, decompress_text(doc), {
+                "owner": str(owner) if owner is not None else None,
+                "username": (job.get("request") or {}).get("username") or artifact_owner(doc.get("pdf_url", "")),
+                "title": doc.get("name", ""),
+                "template": prompt_version.partition("@v")[0],
+                "promptVersion": prompt_version,
+                "pdfName": doc.get("pdf_url", ""),
+                "wordName": doc.get("word_url", ""),
+            })
+            added += 1
+        return added
+
+
+srs_index = SRSIndex(INDEX_DIR)
+
+
+if __name__ == "__main__":
+    from db_connect import get_database
+    print(f"[+] Indexed {srs_index.backfill(get_database()['srs'])} SRS records")
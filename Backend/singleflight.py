@@ -0,0 +1,158 @@
+import os
+import logging
+import asyncio
+import hashlib
+import json
+from typing import AsyncIterator, Callable, Optional
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+_END = object()
+
+# What happens to a generation once all of its clients disconnect: "cancel" or "continue"
+DISCONNECT_POLICY = os.getenv("DISCONNECT_POLICY", "cancel")
+# Lets a page reload rejoin the running generation before it is cancelled
+CANCEL_GRACE_SECONDS = float(os.getenv("CANCEL_GRACE_SECONDS", 5))
+
+
+def request_fingerprint(payload: dict) -> str:
+    """Canonical hash of a request: sorted keys, trimmed strings, unset fields dropped"""
+    canonical = {
+        key: value.strip() if isinstance(value, str) else value
+        for key, value in payload.items()
+        if value not in (None, "")
+    }
+    encoded = json.dumps(canonical, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+class InFlight:
+    """One running generation and the queues of everyone listening to it"""
+
+    def __init__(self, key: str):
+        self.key = key
+        self.events: list[str] = []
+        self.subscribers: set[asyncio.Queue] = set()
+        self.done = False
+        self.task: Optional[asyncio.Task] = None
+
+    def subscribe(self) -> asyncio.Queue:
+        # Late subscribers replay everything published so far
+        queue: asyncio.Queue = asyncio.Queue()
+        for event in self.events:
+            queue.put_nowait(event)
+        if self.done:
+            queue.put_nowait(_END)
+        self.subscribers.add(queue)
+        return queue
+
+    def publish(self, event: str) -> None:
+        self.events.append(event)
+        for queue in self.subscribers:
+            queue.put_nowait(event)
+
+    def finish(self) -> None:
+        self.done = True
+        for queue in self.subscribers:
+            queue.put_nowait(_END)
+
+
+class SingleFlight:
+    """Deduplicate concurrent identical event streams so one producer feeds all callers"""
+
+    def __init__(self):
+        self._inflight: dict[str, InFlight] = {}
+
+    def __len__(self) -> int:
+        return len(self._inflight)
+
+    def start(self, key: str, producer: Callable[[], AsyncIterator[str]]) -> bool:
+        """Run a producer with no client attached yet; returns False if key is already running"""
+        if key in self._inflight:
+            return False
+        flight = InFlight(key)
+        self._inflight[key] = flight
+        flight.task = asyncio.create_task(self._run(flight, producer))
+        metrics.incr("singleflight.started")
+        return True
+
+    async def stream(self, key: str, producer: Callable[[], AsyncIterator[str]]) -> AsyncIterator[str]:
+        """Yield the events of the in-flight producer for key, starting it if needed"""
+        flight = self._inflight.get(key)
+        if flight is None:
+            flight = InFlight(key)
+            self._inflight[key] = flight
+            flight.task = asyncio.create_task(self._run(flight, producer))
+            metrics.incr("singleflight.started")
+        else:
+            metrics.incr("singleflight.joined")
+
+        queue = flight.subscribe()
+        try:
+            while True:
+                event = await queue.get()
+                if event is _END:
+                    return
+                yield event
+        finally:
+            # Starlette cancels the response stream when the client disconnects,
+            # which lands here; the last one out decides the fate of the work
+            flight.subscribers.discard(queue)
+            if not flight.subscribers and not flight.done:
+                self._abandoned(flight)
+
+    def _abandoned(self, flight: InFlight) -> None:
+        if DISCONNECT_POLICY != "cancel":
+            metrics.incr("singleflight.orphaned")
+            return
+        asyncio.get_running_loop().call_later(CANCEL_GRACE_SECONDS, self._cancel_if_abandoned, flight)
+
+    def _cancel_if_abandoned(self, flight: InFlight) -> None:
+        if flight.subscribers or flight.done or flight.task is None:
+            return
+        logger.info("Cancelling generation %s: all clients disconnected", flight.key[:12])
+        metrics.incr("singleflight.cancelled")
+        flight.task.cancel()
+
+    def shared(self, key: str) -> bool:
+        """Whether more than one client is listening to the generation for key"""
+        flight = self._inflight.get(key)
+        return flight is not None and len(flight.subscribers) > 1
+
+    def cancel(self, key: str) -> bool:
+        """Cancel a generation now, unless other clients are still listening to it"""
+        flight = self._inflight.get(key)
+        if flight is None or flight.done or flight.task is None or self.shared(key):
+            return False
+        metrics.incr("singleflight.cancelled")
+        flight.task.cancel()
+        return True
+
+    async def drain(self, timeout: float) -> int:
+        """Wait up to timeout seconds for running generations; returns how many were still running"""
+        tasks = [flight.task for flight in self._inflight.values() if flight.task]
+        if not tasks:
+            return 0
+        logger.info("Draining %d in-flight generation(s)", len(tasks))
+        _, pending = await asyncio.wait(tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        return len(pending)
+
+    async def _run(self, flight: InFlight, producer: Callable[[], AsyncIterator[str]]) -> None:
+        # Runs detached from any one client so a disconnect does not kill the shared work
+        try:
+            async for event in producer():
+                flight.publish(event)
+        except Exception as e:
+            logger.exception("Shared generation %s failed", flight.key[:12])
+            # Tell every client why the stream is ending instead of just closing it
+            flight.publish(f"data: {json.dumps({'status': 'error', 'message': f'Error during SRS generation: {e}'})}\n\n")
+            flight.publish("event: close\ndata: {}\n\n")
+        finally:
+            self._inflight.pop(flight.key, None)
+            flight.finish()
+
+
+generations = SingleFlight()
@@ -0,0 +1,131 @@
+import os
+import logging
+import time
+import asyncio
+import importlib
+import threading
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+# Heavy modules kept out of the import path of app.py and loaded by the warm-up instead
+WARMUP_MODULES = [
+    name.strip()
+    for name in os.getenv("WARMUP_MODULES", "langchain_openai,reportlab.platypus,docx").split(",")
+    if name.strip()
+]
+# Without warm-up the heavy modules load on the first request that needs them
+WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "true").lower() == "true"
+DB_CONNECT_RETRY_MAX = float(os.getenv("DB_CONNECT_RETRY_MAX", 30))
+
+
+class StartupProfile:
+    """Timing of each import and init step from process start until ready"""
+
+    def __init__(self):
+        # Interpreter start is earlier still, but this module is the first one app.py imports
+        self.started = time.perf_counter()
+        self._lock = threading.Lock()
+        self._steps: list[dict] = []
+        self._checks: dict[str, Optional[str]] = {}
+        self.ready_after: Optional[float] = None
+
+    def record(self, name: str, kind: str, start: float, error: Optional[str] = None) -> None:
+        """Record a step that began at start (a perf_counter value) and ends now"""
+        with self._lock:
+            self._steps.append({
+                "name": name,
+                "kind": kind,
+                "startMs": round((start - self.started) * 1000, 1),
+                "durationMs": round((time.perf_counter() - start) * 1000, 1),
+                **({"error": error} if error else {}),
+            })
+
+    @contextmanager
+    def step(self, name: str, kind: str = "init"):
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception as e:
+            self.record(name, kind, start, str(e))
+            raise
+        self.record(name, kind, start)
+
+    def import_module(self, name: str):
+        with self.step(name, "import"):
+            return importlib.import_module(name)
+
+    def expect(self, *checks: str) -> None:
+        """Register the checks that must pass before the app reports ready"""
+        with self._lock:
+            for check in checks:
+                self._checks.setdefault(check, "pending")
+
+    def mark(self, check: str, error: Optional[str] = None) -> None:
+        """Record a readiness check as passed, or as failing with error"""
+        with self._lock:
+            self._checks[check] = error
+            if self.ready_after is None and self._is_ready():
+                self.ready_after = time.perf_counter() - self.started
+                logger.info("Ready after %.0f ms", self.ready_after * 1000)
+
+    def _is_ready(self) -> bool:
+        return all(error is None for error in self._checks.values())
+
+    @property
+    def ready(self) -> bool:
+        with self._lock:
+            return self._is_ready()
+
+    def checks(self) -> dict:
+        with self._lock:
+            return {name: error or "ok" for name, error in self._checks.items()}
+
+    def report(self) -> dict:
+        with self._lock:
+            steps = sorted(self._steps, key=lambda step: step["startMs"])
+        return {
+            "ready": self.ready,
+            "readyAfterMs": round(self.ready_after * 1000, 1) if self.ready_after is not None else None,
+            "uptimeSeconds": round(time.perf_counter() - self.started, 1),
+            "checks": self.checks(),
+            "steps": steps,
+        }
+
+
+profile = StartupProfile()
+
+
+def warm_up(preloads: tuple[Callable[[], object], ...] = ()) -> None:
+    """Import the heavy modules and run preloads now rather than on the first request; runs in a worker thread"""
+    for name in WARMUP_MODULES:
+        try:
+            profile.import_module(name)
+        except ImportError as e:
+            logger.warning("Warm-up could not import %s: %s", name, e)
+    for preload in preloads:
+        try:
+            with profile.step(preload.__module__ + "." + preload.__name__):
+                preload()
+        except Exception as e:
+            logger.warning("Warm-up preload %s failed: %s", preload.__name__, e)
+    profile.mark("warmup")
+
+
+async def connect_with_retry(connect: Callable[[], None]) -> None:
+    """Retry a blocking connect in a thread with backoff until it succeeds"""
+    start = time.perf_counter()
+    delay = 1.0
+    while True:
+        try:
+            await asyncio.to_thread(connect)
+            # One step for the whole wait, retries included
+            profile.record("database", "init", start)
+            profile.mark("database")
+            return
+        except Exception as e:
+            profile.mark("database", str(e))
+            logger.warning("Database not ready, retrying in %.0fs: %s", delay, e)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, DB_CONNECT_RETRY_MAX)
@@ -7,6 +7,9 @@ import requests
 import json
 from typing import Dict, Any
 import os
+import io
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
 
 # Use PORT from environment or default to 5000
 PORT = os.getenv("PORT", "8000")
@@ -159,7 +162,8 @@ def test_sse_stream():
         "selectedSecurity": "OAuth 2.0, data encryption",
         "selectedStorage": "Time-series database for analytics",
         "selectedEnvironment": "Cloud-based SaaS",
-        "selectedLanguage": "English"
+        "selectedLanguage": "English",
+        "username": "test_user"
     }
     
     try:
@@ -232,6 +236,218 @@ def test_sse_stream():
         print(f"Error: {e}")
         return None
 
+def test_conditional_download(username: str, filename: str):
+    """Test ETag revalidation and byte ranges on the PDF download"""
+    print(f"\n=== Testing Conditional Download: {filename} ===")
+    url = f"{BASE_URL}/download-pdf/{username}/{filename}"
+    
+    try:
+        response = requests.get(url)
+        print(f"Status Code: {response.status_code}")
+        etag = response.headers.get('etag')
+        if response.status_code != 200 or not etag:
+            print(f"Error: expected 200 with an ETag, got {response.status_code}")
+            return False
+        size = len(response.content)
+        
+        # An unchanged file is not sent again
+        response = requests.get(url, headers={'If-None-Match': etag})
+        print(f"If-None-Match: {response.status_code}")
+        if response.status_code != 304:
+            return False
+        
+        # Resuming a download sends only the requested bytes
+        response = requests.get(url, headers={'Range': 'bytes=0-99'})
+        print(f"Range: {response.status_code} {response.headers.get('content-range')}")
+        if response.status_code != 206 or response.content != requests.get(url).content[:100]:
+            return False
+        if response.headers.get('content-range') != f"bytes 0-{min(99, size - 1)}/{size}":
+            return False
+        
+        # A stale If-Range gets the whole file
+        response = requests.get(url, headers={'Range': 'bytes=0-99', 'If-Range': '"stale"'})
+        print(f"Stale If-Range: {response.status_code}")
+        return response.status_code == 200 and len(response.content) == size
+    except Exception as e:
+        print(f"Error: {e}")
+        return False
+
+def test_download_bundle(username: str, srs_id: str, pdf_name: str, word_name: str):
+    """Test the ZIP bundle download, by file names and by SRS id"""
+    print(f"\n=== Testing Bundle Download: {username} ===")
+    
+    try:
+        response = requests.get(f"{BASE_URL}/download-bundle/{username}", params={"files": [pdf_name, word_name]})
+        print(f"Status Code: {response.status_code}")
+        if response.status_code != 200:
+            print(f"Error: {response.text}")
+            return False
+        names = zipfile.ZipFile(io.BytesIO(response.content)).namelist()
+        print(f"Entries: {names}")
+        if sorted(names) != sorted([f"pdfs/{pdf_name}", f"docs/{word_name}"]):
+            return False
+        
+        if srs_id:
+            response = requests.get(f"{BASE_URL}/download-bundle/{username}", params={"srsIds": srs_id})
+            print(f"By SRS id: {response.status_code}")
+            if response.status_code != 200:
+                return False
+        
+        # Malformed ids are the caller's mistake, not a server error
+        response = requests.get(f"{BASE_URL}/download-bundle/{username}", params={"srsIds": "not-an-id"})
+        print(f"Invalid SRS id: {response.status_code}")
+        if response.status_code != 400:
+            return False
+        
+        response = requests.get(f"{BASE_URL}/download-bundle/{username}", params={"files": "missing.pdf"})
+        print(f"Missing file: {response.status_code}")
+        return response.status_code == 404
+    except Exception as e:
+        print(f"Error: {e}")
+        return False
+
+def test_srs_text(srs_id: str):
+    """Test fetching the stored text, a single section, and a missing SRS"""
+    print(f"\n=== Testing SRS Text: {srs_id} ===")
+    
+    try:
+        response = requests.get(f"{BASE_URL}/srs/{srs_id}/text")
+        print(f"Status Code: {response.status_code}")
+        if response.status_code != 200:
+            print(f"Error: {response.text}")
+            return None
+        result = response.json()
+        print(f"Text Length: {len(result.get('text', ''))} characters")
+        print(f"Sections: {[section.get('number') for section in result.get('sections', [])]}")
+        
+        etag = response.headers.get('etag')
+        if etag:
+            response = requests.get(f"{BASE_URL}/srs/{srs_id}/text", headers={'If-None-Match': etag})
+            print(f"If-None-Match: {response.status_code}")
+            if response.status_code != 304:
+                return None
+        
+        response = requests.get(f"{BASE_URL}/srs/{srs_id}/text", params={"section": 1})
+        print(f"Section 1: {response.status_code}")
+        if response.status_code != 200 or not response.json().get('section'):
+            return None
+        
+        response = requests.get(f"{BASE_URL}/srs/not-an-id/text")
+        print(f"Invalid id: {response.status_code}")
+        if response.status_code != 404:
+            return None
+        return result
+    except Exception as e:
+        print(f"Error: {e}")
+        return None
+
+def test_regenerate_section(srs_id: str, username: str, original_text: str):
+    """Test rewriting one section of a stored SRS"""
+    print(f"\n=== Testing Section Regeneration: {srs_id} ===")
+    
+    data = {
+        "username": username,
+        "instructions": "Make the introduction shorter",
+        "formats": ["pdf"]
+    }
+    
+    try:
+        response = requests.post(f"{BASE_URL}/srs/{srs_id}/sections/1/regenerate", json=data)
+        print(f"Status Code: {response.status_code}")
+        if response.status_code != 200:
+            print(f"Error: {response.text}")
+            return False
+        result = response.json()
+        print(f"PDF Name: {result.get('pdfName')}")
+        print(f"Word Name: {result.get('wordName')}")
+        
+        # The stored text now carries the rewritten section
+        stored = requests.get(f"{BASE_URL}/srs/{srs_id}/text").json()
+        if stored.get('text') == original_text:
+            print("Error: the stored text did not change")
+            return False
+        
+        response = requests.post(f"{BASE_URL}/srs/{srs_id}/sections/99/regenerate", json=data)
+        print(f"Missing section: {response.status_code}")
+        return response.status_code == 404
+    except Exception as e:
+        print(f"Error: {e}")
+        return False
+
+def test_translation():
+    """Test generating an SRS together with its translations"""
+    print("\n=== Testing SRS Translation ===")
+    
+    data = {
+        "main": "A library book reservation system",
+        "selectedPurpose": "Let members reserve and renew books online",
+        "selectedLanguage": "English",
+        "localize": True,
+        "languages": ["French"]
+    }
+    
+    try:
+        response = requests.post(f"{BASE_URL}/generate-srs", json=data)
+        print(f"Status Code: {response.status_code}")
+        if response.status_code != 200:
+            print(f"Error: {response.text}")
+            return False
+        translations = response.json().get('translations') or []
+        for entry in translations:
+            if entry.get('error'):
+                print(f"❌ {entry.get('language')}: {entry['error']}")
+            else:
+                print(f"{entry.get('language')}: {entry.get('title')} ({len(entry.get('text', ''))} characters, truncated: {entry.get('truncated')})")
+        return [entry.get('language') for entry in translations] == ["French"] and all(
+            entry.get('text') and not entry.get('error') for entry in translations
+        )
+    except Exception as e:
+        print(f"Error: {e}")
+        return False
+
+def test_rate_limits():
+    """
+    Test that overload is refused with 429 rather than a server error.
+    Start the server with a small MAX_QUEUED_PER_USER (and optionally DAILY_TOKEN_QUOTA)
+    and set the same variables here to see the limits hit.
+    """
+    print("\n=== Testing Rate Limits ===")
+    user_id = "rate_limit_test_user"
+    burst = int(os.getenv("PER_USER_CONCURRENCY", 2)) + int(os.getenv("MAX_QUEUED_PER_USER", 10)) + 1
+    
+    def generate(n: int) -> requests.Response:
+        data = {"main": f"Rate limit test project {n}", "userId": user_id, "detailLevel": "brief"}
+        return requests.post(f"{BASE_URL}/generate-srs", json=data)
+    
+    try:
+        # One more request than the user may run and queue at once
+        with ThreadPoolExecutor(max_workers=burst) as pool:
+            responses = list(pool.map(generate, range(burst)))
+        statuses = [response.status_code for response in responses]
+        print(f"Burst of {burst}: {statuses}")
+        if any(status not in (200, 429) for status in statuses):
+            return False
+        if 429 not in statuses:
+            print("❌ Expected the admission queue to refuse at least one request")
+            return False
+        
+        # With a quota configured, a user over it is told when to retry
+        usage = requests.get(f"{BASE_URL}/usage/{user_id}").json()
+        daily_quota = (usage.get('quotas') or {}).get('dailyTokens')
+        if not daily_quota:
+            print("No DAILY_TOKEN_QUOTA configured, skipping the quota check")
+            return True
+        print(f"Used {usage.get('dayTokens')} of {daily_quota} tokens today")
+        if usage.get('dayTokens', 0) < daily_quota:
+            print("Quota not used up yet, skipping the quota check")
+            return True
+        response = generate(burst)
+        print(f"Over quota: {response.status_code} Retry-After: {response.headers.get('retry-after')}")
+        return response.status_code == 429 and response.headers.get('retry-after') is not None
+    except Exception as e:
+        print(f"Error: {e}")
+        return False
+
 def run_all_tests():
     """Run all tests in sequence"""
     print("=" * 60)
@@ -287,6 +503,49 @@ def run_all_tests():
     else:
         print("❌ SSE stream test failed")
     
+    # Test 7: Downloads, stored text and section rewrites of the streamed SRS
+    if sse_result:
+        username = "test_user"
+        pdf_name = sse_result.get('pdfName')
+        word_name = sse_result.get('wordName')
+        srs_id = sse_result.get('srsId')
+        
+        if test_conditional_download(username, pdf_name):
+            print("✅ Conditional download test passed")
+        else:
+            print("❌ Conditional download test failed")
+        
+        if test_download_bundle(username, srs_id, pdf_name, word_name):
+            print("✅ Bundle download test passed")
+        else:
+            print("❌ Bundle download test failed")
+        
+        if srs_id:
+            stored = test_srs_text(srs_id)
+            if stored:
+                print("✅ SRS text test passed")
+            else:
+                print("❌ SRS text test failed")
+            
+            if stored and test_regenerate_section(srs_id, username, stored.get('text')):
+                print("✅ Section regeneration test passed")
+            else:
+                print("❌ Section regeneration test failed")
+        else:
+            print("⚠️  No srsId in the stream result (database unavailable), skipping text and section tests")
+    
+    # Test 8: Translation
+    if test_translation():
+        print("✅ Translation test passed")
+    else:
+        print("❌ Translation test failed")
+    
+    # Test 9: Admission queue and quota limits
+    if test_rate_limits():
+        print("✅ Rate limit test passed")
+    else:
+        print("❌ Rate limit test failed")
+    
     print("\n" + "=" * 60)
     print("All Tests Completed!")
     print("=" * 60)
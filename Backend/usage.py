@@ -0,0 +1,141 @@
+import os
+import time
+import threading
+import datetime as dt
+from langchain_core.messages import BaseMessage
+from metrics import metrics
+
+# Tokens a user may spend per UTC day / calendar month; 0 means unlimited
+DAILY_TOKEN_QUOTA = int(os.getenv("DAILY_TOKEN_QUOTA", 0))
+MONTHLY_TOKEN_QUOTA = int(os.getenv("MONTHLY_TOKEN_QUOTA", 0))
+# Seconds between batched writes of the counters to MongoDB
+USAGE_FLUSH_INTERVAL = float(os.getenv("USAGE_FLUSH_INTERVAL", 10))
+# How long totals read from MongoDB are trusted by quota checks
+USAGE_CACHE_SECONDS = float(os.getenv("USAGE_CACHE_SECONDS", 30))
+# Used when the provider reports no usage, e.g. streamed or local completions
+CHARS_PER_TOKEN = 4
+
+
+class QuotaExceededError(Exception):
+    """Raised before an LLM call by a user who has used up a quota"""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1 if text else 0
+
+
+def response_usage(message, prompt: list[BaseMessage], text: str) -> tuple[int, int]:
+    """Input and output tokens of a completion, as reported by the provider or estimated"""
+    usage = getattr(message, "usage_metadata", None)
+    if usage:
+        return usage["input_tokens"], usage["output_tokens"]
+    return sum(estimate_tokens(str(m.content)) for m in prompt), estimate_tokens(text)
+
+
+def _today() -> str:
+    return dt.datetime.utcnow().strftime("%Y-%m-%d")
+
+
+def _seconds_until(reset: dt.datetime) -> int:
+    return max(1, int((reset - dt.datetime.utcnow()).total_seconds()))
+
+
+class UsageTracker:
+    """
+    Token counters per user and UTC day.
+    Usage is added up in memory and written to MongoDB in batches by flush();
+    quota checks combine the stored totals (cached briefly) with what this
+    worker has not flushed yet, so other workers' usage shows up after at most
+    USAGE_FLUSH_INTERVAL + USAGE_CACHE_SECONDS.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending: dict[tuple[str, str], dict] = {}
+        self._stored: dict[str, tuple[float, str, int, int]] = {}
+        self.repo = None  # UsageRepository, set once MongoDB is connected
+
+    def record(self, user: str, input_tokens: int, output_tokens: int) -> None:
+        with self._lock:
+            counters = self._pending.setdefault((user, _today()), {
+                "inputTokens": 0, "outputTokens": 0, "totalTokens": 0, "requests": 0
+            })
+            counters["inputTokens"] += input_tokens
+            counters["outputTokens"] += output_tokens
+            counters["totalTokens"] += input_tokens + output_tokens
+            counters["requests"] += 1
+        metrics.incr("usage.tokens", input_tokens + output_tokens)
+
+    def flush(self) -> int:
+        """Write pending counters in one batch; returns the number of (user, day) rows written"""
+        if self.repo is None:
+            return 0
+        with self._lock:
+            batch, self._pending = self._pending, {}
+        if not batch:
+            return 0
+        try:
+            self.repo.add(batch)
+        except Exception:
+            # Put them back so the next flush retries
+            with self._lock:
+                for key, counters in batch.items():
+                    pending = self._pending.setdefault(key, dict.fromkeys(counters, 0))
+                    for name, value in counters.items():
+                        pending[name] += value
+            raise
+        with self._lock:
+            # Flushed usage is in MongoDB now, so cached totals for these users are stale
+            for user, _ in batch:
+                self._stored.pop(user, None)
+        return len(batch)
+
+    def _stored_totals(self, user: str, day: str) -> tuple[int, int]:
+        cached = self._stored.get(user)
+        if cached and cached[1] == day and time.monotonic() - cached[0] < USAGE_CACHE_SECONDS:
+            return cached[2], cached[3]
+        if self.repo is None:
+            return 0, 0
+        day_total, month_total = self.repo.totals(user, day)
+        self._stored[user] = (time.monotonic(), day, day_total, month_total)
+        return day_total, month_total
+
+    def totals(self, user: str) -> dict:
+        """Tokens used today and this month, including usage not flushed yet (blocking)"""
+        day = _today()
+        day_total, month_total = self._stored_totals(user, day)
+        with self._lock:
+            for (pending_user, pending_day), counters in self._pending.items():
+                if pending_user != user:
+                    continue
+                if pending_day == day:
+                    day_total += counters["totalTokens"]
+                if pending_day[:7] == day[:7]:
+                    month_total += counters["totalTokens"]
+        return {"day": day, "dayTokens": day_total, "monthTokens": month_total}
+
+    def check(self, user: str) -> dict:
+        """Raise QuotaExceededError if the user has used up a quota (blocking)"""
+        if not DAILY_TOKEN_QUOTA and not MONTHLY_TOKEN_QUOTA:
+            return {}
+        totals = self.totals(user)
+        now = dt.datetime.utcnow()
+        if DAILY_TOKEN_QUOTA and totals["dayTokens"] >= DAILY_TOKEN_QUOTA:
+            metrics.incr("usage.rejected.daily")
+            tomorrow = dt.datetime(now.year, now.month, now.day) + dt.timedelta(days=1)
+            raise QuotaExceededError("Daily token quota exceeded", _seconds_until(tomorrow))
+        if MONTHLY_TOKEN_QUOTA and totals["monthTokens"] >= MONTHLY_TOKEN_QUOTA:
+            metrics.incr("usage.rejected.monthly")
+            next_month = dt.datetime(now.year + now.month // 12, now.month % 12 + 1, 1)
+            raise QuotaExceededError("Monthly token quota exceeded", _seconds_until(next_month))
+        return totals
+
+    def quotas(self) -> dict:
+        return {"dailyTokens": DAILY_TOKEN_QUOTA or None, "monthlyTokens": MONTHLY_TOKEN_QUOTA or None}
+
+
+usage_tracker = UsageTracker()
@@ -0,0 +1,97 @@
+import os
+import json
+import asyncio
+import logging
+from typing import AsyncIterator, Awaitable, Callable, Optional
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Jobs one WebSocket connection may run at once
+WS_MAX_JOBS = int(os.getenv("WS_MAX_JOBS", 4))
+
+
+class GenerationControl:
+    """Requests a client has made of a running generation; checked by the generation as it streams"""
+
+    def __init__(self):
+        self.summary = False  # Finish the rest of the document briefly
+
+
+def parse_sse(event: str) -> tuple[str, dict]:
+    """Split an SSE message from srs_generation_stream into its event name and JSON data"""
+    name, data = "message", ""
+    for line in event.splitlines():
+        if line.startswith("event: "):
+            name = line[len("event: "):]
+        elif line.startswith("data: "):
+            data += line[len("data: "):]
+    return name, json.loads(data) if data else {}
+
+
+class JobMultiplexer:
+    """
+    Jobs running over one WebSocket, each tagged with the jobId the client chose.
+    Every message to the client carries its jobId, so any number of generations
+    and section rewrites can share the connection.
+    """
+
+    def __init__(self, websocket):
+        self.websocket = websocket
+        self.jobs: dict[str, asyncio.Task] = {}
+        self._send_lock = asyncio.Lock()
+
+    async def send(self, message: dict) -> None:
+        # Jobs send concurrently; one frame at a time
+        async with self._send_lock:
+            await self.websocket.send_json(message)
+
+    async def error(self, message: str, job_id: Optional[str] = None, **fields) -> None:
+        await self.send({"type": "error", "jobId": job_id, "message": message, **fields})
+
+    def start(self, job_id: str, run: Callable[[], Awaitable[Optional[bool]]]) -> None:
+        """
+        Run a job; raises ValueError for a duplicate jobId or when the connection is at WS_MAX_JOBS.
+        A job that returns False has already sent its error, and gets no "done" message after it.
+        """
+        if not isinstance(job_id, str) or not job_id:
+            raise ValueError("A jobId is required")
+        if job_id in self.jobs:
+            raise ValueError(f"Job {job_id} is already running on this connection")
+        if len(self.jobs) >= WS_MAX_JOBS:
+            raise ValueError(f"At most {WS_MAX_JOBS} jobs can run on one connection")
+        self.jobs[job_id] = asyncio.create_task(self._run(job_id, run))
+        metrics.incr("websocket.jobs")
+
+    async def _run(self, job_id: str, run: Callable[[], Awaitable[Optional[bool]]]) -> None:
+        try:
+            if await run() is not False:
+                await self.send({"type": "done", "jobId": job_id})
+        except asyncio.CancelledError:
+            # Cancelled by the client, or the connection is closing
+            pass
+        except Exception:
+            logger.exception("WebSocket job %s failed", job_id)
+        finally:
+            self.jobs.pop(job_id, None)
+
+    async def forward(self, job_id: str, events: AsyncIterator[str]) -> None:
+        """Relay an SSE event stream as JSON messages; the SSE close marker becomes the "done" message"""
+        async for event in events:
+            name, data = parse_sse(event)
+            if name != "close":
+                await self.send({"type": "event", "jobId": job_id, "event": data})
+
+    def cancel(self, job_id: str) -> bool:
+        task = self.jobs.get(job_id)
+        if task is None:
+            return False
+        task.cancel()
+        return True
+
+    async def close(self) -> None:
+        """Stop every job when the connection goes away"""
+        tasks = list(self.jobs.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)